@@ -0,0 +1,296 @@
+# batchSimulator.py
+# -----------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Plays many games of classic Pacman against random ghosts in lockstep.
+
+A BatchSimulator keeps every game as a handful of plain numbers (cells,
+scared timers, food and capsule bits, score) in one list per quantity,
+and doActions advances all of them by one round: Pacman's move followed
+by each ghost's.  The rules are those of pacman.ClassicGameRules, and
+ghosts draw their moves from the random module exactly as
+ghostAgents.RandomGhost does, so a single game played with the same seed
+and Pacman moves follows the same course as in pacman.py.  Use
+getGameState to look at a game through the usual GameState interface,
+e.g. for feature extraction.
+"""
+
+from game import Actions, Directions, Configuration, BitGrid
+from pacman import GameState, SCARED_TIME, TIME_PENALTY, COLLISION_TOLERANCE
+import random
+import util
+
+FOOD_SCORE = 10
+WIN_SCORE = 500
+LOSE_SCORE = -500
+GHOST_SCORE = 200
+
+# Ghosts are tracked in half steps so that scared ghosts, which move at
+# half speed, stay on integer coordinates
+HALF_STEP_VECTORS = {Directions.NORTH: (0, 1),
+                     Directions.SOUTH: (0, -1),
+                     Directions.EAST:  (1, 0),
+                     Directions.WEST:  (-1, 0),
+                     Directions.STOP:  (0, 0)}
+COLLISION_HALF_STEPS = int(2 * COLLISION_TOLERANCE)
+
+UNIFORM_THRESHOLDS_CACHE = {}
+
+def getUniformThresholds(n):
+    """
+    Returns the running totals util.sample compares random.random()
+    against when drawing one of n equally likely values, computed the
+    same way so that draws match RandomGhost's.
+    """
+    if n not in UNIFORM_THRESHOLDS_CACHE:
+        distribution = [1.0 / float(n)] * n
+        if sum(distribution) != 1:
+            distribution = util.normalize(distribution)
+        thresholds = [distribution[0]]
+        for p in distribution[1:]:
+            thresholds.append(thresholds[-1] + p)
+        UNIFORM_THRESHOLDS_CACHE[n] = thresholds
+    return UNIFORM_THRESHOLDS_CACHE[n]
+
+class BatchSimulator:
+    """
+    numGames games on one layout, each against up to numGhosts random
+    ghosts.  Games are numbered 0 .. numGames-1.  Finished games stay
+    finished (and are skipped by doActions) until they are reset.
+    """
+    def __init__(self, layout, numGames, numGhosts=4):
+        self.layout = layout
+        self.numGames = numGames
+        self.width = layout.width
+        self.height = layout.height
+
+        # Same agents as GameStateData.initialize picks
+        pacmanStart = [pos for isPacman, pos in layout.agentPositions if isPacman][0]
+        ghostStarts = [pos for isPacman, pos in layout.agentPositions if not isPacman][:numGhosts]
+        self.numGhosts = len(ghostStarts)
+        self.pacmanStart = self.getCell(pacmanStart)
+        self.ghostStarts = [(2 * x, 2 * y) for x, y in ghostStarts]
+
+        self.initialFood = BitGrid.fromGrid(layout.food).bits
+        self.initialNumFood = layout.food.count()
+        self.initialCapsules = 0
+        for pos in layout.capsules:
+            self.initialCapsules |= 1 << self.getCell(pos)
+
+        # The layout's move tables, keyed by cell: for every open cell
+        # Pacman's legal actions, the cell each one leads to, and a ghost's
+        # legal actions for each direction it may face
+        tables = layout.getMoveTables()
+        self.legalPacmanActions = {}
+        self.successorCells = {}
+        self.legalGhostActions = {}
+        for pos, actions in tables.possibleActions.items():
+            cell = self.getCell(pos)
+            self.legalPacmanActions[cell] = list(actions)
+            self.successorCells[cell] = dict([(action, self.getCell(Actions.getSuccessor(pos, action)))
+                                             for action in actions])
+            self.legalGhostActions[cell] = dict([(direction, list(tables.ghostActions[(pos, direction)]))
+                                                for direction in HALF_STEP_VECTORS])
+
+        self.pacmanCells = [0] * numGames
+        self.pacmanDirections = [Directions.STOP] * numGames
+        self.ghostPositions = [[None] * numGames for g in range(self.numGhosts)]
+        self.ghostDirections = [[Directions.STOP] * numGames for g in range(self.numGhosts)]
+        self.scaredTimers = [[0] * numGames for g in range(self.numGhosts)]
+        self.food = [0] * numGames
+        self.numFood = [0] * numGames
+        self.capsules = [0] * numGames
+        self.scores = [0] * numGames
+        self.wins = [False] * numGames
+        self.losses = [False] * numGames
+        self.lastGhostActions = [[] for i in range(numGames)]
+        self.reset()
+
+    def getCell(self, pos):
+        x, y = pos
+        return int(x) * self.height + int(y)
+
+    def getPosition(self, cell):
+        return (cell // self.height, cell % self.height)
+
+    def reset(self, game=None):
+        """
+        Starts game number game over, or all of them if game is None.
+        """
+        if game is None:
+            games = range(self.numGames)
+        else:
+            games = [game]
+        for i in games:
+            self.pacmanCells[i] = self.pacmanStart
+            self.pacmanDirections[i] = Directions.STOP
+            for g in range(self.numGhosts):
+                self.ghostPositions[g][i] = self.ghostStarts[g]
+                self.ghostDirections[g][i] = Directions.STOP
+                self.scaredTimers[g][i] = 0
+            self.food[i] = self.initialFood
+            self.numFood[i] = self.initialNumFood
+            self.capsules[i] = self.initialCapsules
+            self.scores[i] = 0
+            self.wins[i] = False
+            self.losses[i] = False
+            self.lastGhostActions[i] = []
+
+    def isTerminal(self, game):
+        return self.wins[game] or self.losses[game]
+
+    def getLegalActions(self, game):
+        """
+        Returns Pacman's legal actions in game, in the order
+        GameState.getLegalActions would.
+        """
+        if self.wins[game] or self.losses[game]: return []
+        return self.legalPacmanActions[self.pacmanCells[game]][:]
+
+    def doActions(self, actions):
+        """
+        Plays one round of every unfinished game: Pacman takes actions[i]
+        in game i, then the ghosts of that game move in turn.  Returns
+        the change in each game's score (0 for games that were already
+        over).
+        """
+        legalPacmanActions = self.legalPacmanActions
+        successorCells = self.successorCells
+        legalGhostActions = self.legalGhostActions
+        height = self.height
+        numGhosts = self.numGhosts
+        ghostPositions = self.ghostPositions
+        ghostDirections = self.ghostDirections
+        scaredTimers = self.scaredTimers
+        rewards = [0] * self.numGames
+        for i in range(self.numGames):
+            if self.wins[i] or self.losses[i]: continue
+            action = actions[i]
+            cell = self.pacmanCells[i]
+            if action not in legalPacmanActions[cell]:
+                raise Exception("Illegal action " + str(action))
+
+            # Pacman moves and eats
+            cell = successorCells[cell][action]
+            self.pacmanCells[i] = cell
+            if action != Directions.STOP:
+                self.pacmanDirections[i] = action
+            scoreChange = -TIME_PENALTY
+            win = lose = False
+            bit = 1 << cell
+            if self.food[i] & bit:
+                self.food[i] ^= bit
+                self.numFood[i] -= 1
+                scoreChange += FOOD_SCORE
+                if self.numFood[i] == 0:
+                    scoreChange += WIN_SCORE
+                    win = True
+            if self.capsules[i] & bit:
+                self.capsules[i] ^= bit
+                for g in range(numGhosts):
+                    scaredTimers[g][i] = SCARED_TIME
+            px, py = 2 * (cell // height), 2 * (cell % height)
+
+            # Pacman may run into any ghost
+            for g in range(numGhosts):
+                gx, gy = ghostPositions[g][i]
+                if abs(gx - px) + abs(gy - py) <= COLLISION_HALF_STEPS:
+                    if scaredTimers[g][i] > 0:
+                        scoreChange += GHOST_SCORE
+                        ghostPositions[g][i] = self.ghostStarts[g]
+                        ghostDirections[g][i] = Directions.STOP
+                        scaredTimers[g][i] = 0
+                    elif not win:
+                        scoreChange += LOSE_SCORE
+                        lose = True
+
+            # Then each ghost takes its turn, unless the game is over
+            ghostActions = []
+            g = 0
+            while g < numGhosts and not win and not lose:
+                gx, gy = ghostPositions[g][i]
+                direction = ghostDirections[g][i]
+                if gx % 2 or gy % 2:
+                    # In between grid points, ghosts must continue straight
+                    legal = [direction]
+                else:
+                    legal = legalGhostActions[(gx // 2) * height + gy // 2][direction]
+                if legal:
+                    # Same draw as RandomGhost: one random() against the
+                    # running totals of a uniform distribution over the
+                    # actions in sorted order
+                    legal = sorted(legal)
+                    thresholds = getUniformThresholds(len(legal))
+                    choice = random.random()
+                    k = 0
+                    while choice > thresholds[k]:
+                        k += 1
+                    move = legal[k]
+                    dx, dy = HALF_STEP_VECTORS[move]
+                    timer = scaredTimers[g][i]
+                    if timer == 0:
+                        dx, dy = 2 * dx, 2 * dy
+                    gx, gy = gx + dx, gy + dy
+                    ghostDirections[g][i] = move
+                else:
+                    move = Directions.STOP
+                    timer = scaredTimers[g][i]
+                ghostActions.append(move)
+                if timer == 1:
+                    # Scared ghosts end up back on the grid
+                    gx, gy = gx + gx % 2, gy + gy % 2
+                scaredTimers[g][i] = max(0, timer - 1)
+                ghostPositions[g][i] = (gx, gy)
+
+                if abs(gx - px) + abs(gy - py) <= COLLISION_HALF_STEPS:
+                    if scaredTimers[g][i] > 0:
+                        scoreChange += GHOST_SCORE
+                        ghostPositions[g][i] = self.ghostStarts[g]
+                        ghostDirections[g][i] = Directions.STOP
+                        scaredTimers[g][i] = 0
+                    else:
+                        scoreChange += LOSE_SCORE
+                        lose = True
+                g += 1
+
+            self.lastGhostActions[i] = ghostActions
+            self.scores[i] += scoreChange
+            self.wins[i] = win
+            self.losses[i] = lose
+            rewards[i] = scoreChange
+        return rewards
+
+    def getGameState(self, game):
+        """
+        Returns a pacman.GameState showing game as it is now.
+        """
+        state = GameState()
+        state.initialize(self.layout, self.numGhosts)
+        data = state.data
+        pacmanConfiguration = Configuration(self.getPosition(self.pacmanCells[game]), self.pacmanDirections[game])
+        data.agentStates[0] = data.agentStates[0].withConfiguration(pacmanConfiguration)
+        for g in range(self.numGhosts):
+            gx, gy = self.ghostPositions[g][game]
+            ghostConfiguration = Configuration((gx / 2.0, gy / 2.0), self.ghostDirections[g][game])
+            ghostState = data.agentStates[g + 1].withConfiguration(ghostConfiguration)
+            data.agentStates[g + 1] = ghostState.withScaredTimer(self.scaredTimers[g][game])
+        data.food = BitGrid(self.width, self.height)
+        data.food.bits = self.food[game]
+        data.capsules = [pos for pos in self.layout.capsules if self.capsules[game] & (1 << self.getCell(pos))]
+        data.score = self.scores[game]
+        data._win = self.wins[game]
+        data._lose = self.losses[game]
+        data._foodHash = None
+        data._capsuleHash = None
+        return state
@@ -0,0 +1,200 @@
+# learningBenchmark.py
+# --------------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Measures how fast the learning agents train on each Pacman layout.
+
+  python benchmarks/learningBenchmark.py -o results.json
+
+Every (layout, agent) pair plays --episodes quiet training episodes
+against random ghosts, from a fixed seed, in a process of its own so
+that peak memory is measured per pair.  A pair stops early after the
+first episode that ends past --timeLimit seconds.  The JSON written
+holds, per pair: episodes and Pacman steps per second, percentiles of
+the time taken by getAction and update (in milliseconds), the peak
+resident set size, and the scores.  Compare files from two commits to
+spot regressions.
+"""
+
+import os, sys, time, json, random, resource, subprocess
+from optparse import OptionParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# (agent, extractor) pairs; extractor None for tabular agents
+AGENTS = [('PacmanQAgent', None),
+          ('ApproximateQAgent', 'IdentityExtractor'),
+          ('ApproximateQAgent', 'SimpleExtractor'),
+          ('ApproximateQAgent', 'NewExtractor'),
+          ('ApproximateQAgent', 'NewExtractor2')]
+
+PERCENTILES = [50, 90, 99]
+
+def getLayoutNames():
+    return sorted([name[:-len('.lay')] for name in os.listdir(os.path.join(ROOT, 'layouts'))
+                   if name.endswith('.lay')])
+
+def timed(function, timings):
+    "Wraps function so that the seconds each call takes are appended to timings"
+    def timedFunction(*args):
+        start = time.time()
+        result = function(*args)
+        timings.append(time.time() - start)
+        return result
+    return timedFunction
+
+def summarizeTimings(timings):
+    """
+    Returns the mean and PERCENTILES of timings, in milliseconds.
+    """
+    if not timings:
+        return None
+    timings = sorted(timings)
+    summary = {'calls': len(timings), 'mean': 1000.0 * sum(timings) / len(timings)}
+    for p in PERCENTILES:
+        summary['p%d' % p] = 1000.0 * timings[int(round(p / 100.0 * (len(timings) - 1)))]
+    return summary
+
+def runCase(layoutName, agentName, extractor, episodes, seed, timeLimit):
+    """
+    Trains a fresh agent on one layout in this process and returns the
+    measurements as a dict.
+    """
+    import layout, pacman, qlearningAgents, ghostAgents, textDisplay, util
+
+    random.seed(seed)
+    lay = layout.getLayout(layoutName)
+    agentArgs = {'numTraining': episodes}
+    if extractor is not None:
+        agentArgs['extractor'] = extractor
+    agent = getattr(qlearningAgents, agentName)(**agentArgs)
+    ghosts = [ghostAgents.RandomGhost(i + 1) for i in range(lay.getNumGhosts())]
+
+    actionTimings, updateTimings = [], []
+    agent.getAction = timed(agent.getAction, actionTimings)
+    agent.update = timed(agent.update, updateTimings)
+
+    rules = pacman.ClassicGameRules()
+    scores = []
+    wins = 0
+    util.mutePrint()
+    try:
+        start = time.time()
+        while len(scores) < episodes and time.time() - start < timeLimit:
+            game = rules.newGame(lay, agent, ghosts, textDisplay.NullGraphics(), True)
+            game.runFast()
+            scores.append(game.state.getScore())
+            wins += game.state.isWin()
+        elapsed = time.time() - start
+    finally:
+        util.unmutePrint()
+
+    return {'layout': layoutName,
+            'agent': agentName,
+            'extractor': extractor,
+            'episodes': len(scores),
+            'steps': len(actionTimings),
+            'seconds': elapsed,
+            'episodesPerSecond': len(scores) / elapsed,
+            'stepsPerSecond': len(actionTimings) / elapsed,
+            'getAction': summarizeTimings(actionTimings),
+            'update': summarizeTimings(updateTimings),
+            'peakRssKB': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'averageScore': sum(scores) / float(len(scores)) if scores else None,
+            'wins': wins}
+
+def getCommit():
+    try:
+        process = subprocess.Popen(['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = process.communicate()
+        if process.returncode == 0:
+            return out.strip()
+    except OSError:
+        pass
+    return None
+
+def readCommand(argv):
+    parser = OptionParser(usage=__doc__)
+    parser.add_option('-l', '--layouts', dest='layouts', default=None,
+                      help='Comma separated layouts to run [Default: all in layouts/]')
+    parser.add_option('-a', '--agents', dest='agents', default=None,
+                      help='Comma separated agents or extractors to run, e.g. PacmanQAgent,SimpleExtractor [Default: all]')
+    parser.add_option('-n', '--episodes', dest='episodes', type='int', default=10,
+                      help='Training episodes per layout and agent [Default: %default]')
+    parser.add_option('-s', '--seed', dest='seed', type='int', default=188,
+                      help='Random seed every run starts from [Default: %default]')
+    parser.add_option('-t', '--timeLimit', dest='timeLimit', type='float', default=60.0,
+                      help='Seconds after which a run starts no new episode [Default: %default]')
+    parser.add_option('-o', '--output', dest='output', default=None,
+                      help='File to write the JSON results to [Default: standard output]')
+    parser.add_option('--case', dest='case', default=None,
+                      help='Run a single layout,agent,extractor in this process (used internally)')
+    options, otherjunk = parser.parse_args(argv)
+    if otherjunk:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+def main(argv):
+    options = readCommand(argv)
+    if options.case is not None:
+        layoutName, agentName, extractor = options.case.split(',')
+        result = runCase(layoutName, agentName, extractor or None,
+                         options.episodes, options.seed, options.timeLimit)
+        print json.dumps(result)
+        return
+
+    layoutNames = options.layouts.split(',') if options.layouts else getLayoutNames()
+    agents = AGENTS
+    if options.agents:
+        wanted = options.agents.split(',')
+        agents = [(agentName, extractor) for agentName, extractor in AGENTS
+                  if (extractor or agentName) in wanted]
+
+    results = []
+    for layoutName in layoutNames:
+        for agentName, extractor in agents:
+            case = '%s,%s,%s' % (layoutName, agentName, extractor or '')
+            sys.stderr.write('%s %s ... ' % (layoutName, extractor or agentName))
+            # A process per run keeps the peak memory of one run from
+            # hiding that of the next
+            process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--case', case,
+                                        '-n', str(options.episodes), '-s', str(options.seed),
+                                        '-t', str(options.timeLimit)],
+                                       cwd=ROOT, stdout=subprocess.PIPE)
+            out, err = process.communicate()
+            if process.returncode != 0:
+                raise Exception('Benchmark %s failed' % case)
+            result = json.loads(out.strip().splitlines()[-1])
+            sys.stderr.write('%.1f episodes/s, %.0f steps/s\n' % (result['episodesPerSecond'], result['stepsPerSecond']))
+            results.append(result)
+
+    report = {'commit': getCommit(),
+              'python': sys.version.split()[0],
+              'seed': options.seed,
+              'episodes': options.episodes,
+              'timeLimit': options.timeLimit,
+              'results': results}
+    if options.output:
+        f = open(options.output, 'w')
+        try:
+            json.dump(report, f, indent=2, sort_keys=True, separators=(',', ': '))
+        finally:
+            f.close()
+    else:
+        print json.dumps(report, indent=2, sort_keys=True, separators=(',', ': '))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -15,16 +15,61 @@
 "Feature extractors for Pacman game states"
 
 from game import Directions, Actions
+import collections
 import util
 
 class FeatureExtractor:
+    # Extractors that always produce the same features can list their
+    # names here and implement getFeatureVector instead of getFeatures.
+    # Learners can then keep one weight per position in this list.
+    featureNames = None
+
     def getFeatures(self, state, action):
         """
           Returns a dict from features to counts
           Usually, the count will just be 1.0 for
           indicator functions.
         """
-        util.raiseNotDefined()
+        if self.featureNames is None:
+            util.raiseNotDefined()
+        return util.Counter(zip(self.featureNames, self.getFeatureVector(state, action)))
+
+    def getFeatureVector(self, state, action):
+        """
+          Returns a list with the value of every feature in
+          featureNames, in the same order
+        """
+        features = self.getFeatures(state, action)
+        return [features.get(name, 0.0) for name in self.featureNames]
+
+    def getFeatureMatrix(self, state, actions):
+        """
+          Returns one feature vector per action, in the order of actions.
+          Extractors can override this to do the work that depends only
+          on the state once for all the actions.
+        """
+        return [self.getFeatureVector(state, action) for action in actions]
+
+    def getFeaturesForActions(self, state, actions):
+        """
+          Returns getFeatures(state, action) for every action, in the
+          order of actions, through getFeatureMatrix if there is one
+        """
+        if self.featureNames is None:
+            return [self.getFeatures(state, action) for action in actions]
+        names = self.featureNames
+        return [util.Counter(zip(names, vector)) for vector in self.getFeatureMatrix(state, actions)]
+
+def getGhostReach(ghostPositions, layout):
+    """
+    Returns a dict from each cell to the number of ghosts that are at or
+    next to it (see Actions.getLegalNeighbors)
+    """
+    reach = {}
+    for g in ghostPositions:
+        for cell in layout.getLegalNeighbors(g):
+            reach[cell] = reach.get(cell, 0) + 1
+    return reach
 
 class IdentityExtractor(FeatureExtractor):
     def getFeatures(self, state, action):
@@ -46,10 +91,10 @@ def closestFood(pos, food, walls):
     closestFood -- this is similar to the function that we have
     worked on in the search project; here its all in one place
     """
-    fringe = [(pos[0], pos[1], 0)]
+    fringe = collections.deque([(pos[0], pos[1], 0)])
     expanded = set()
     while fringe:
-        pos_x, pos_y, dist = fringe.pop(0)
+        pos_x, pos_y, dist = fringe.popleft()
         if (pos_x, pos_y) in expanded:
             continue
         expanded.add((pos_x, pos_y))
@@ -71,36 +116,41 @@ class SimpleExtractor(FeatureExtractor):
     - whether a ghost collision is imminent
     - whether a ghost is one step away
     """
+    featureNames = ["bias", "#-of-ghosts-1-step-away", "eats-food", "closest-food"]
 
-    def getFeatures(self, state, action):
+    def getFeatureVector(self, state, action):
+        return self.getFeatureMatrix(state, [action])[0]
+
+    def getFeatureMatrix(self, state, actions):
         # extract the grid of food and wall locations and get the ghost locations
         food = state.getFood()
         walls = state.getWalls()
-        ghosts = state.getGhostPositions()
-
-        features = util.Counter()
-
-        features["bias"] = 1.0
-
-        # compute the location of pacman after he takes the action
+        ghostReach = getGhostReach(state.getGhostPositions(), state.data.layout)
         x, y = state.getPacmanPosition()
-        dx, dy = Actions.directionToVector(action)
-        next_x, next_y = int(x + dx), int(y + dy)
-
-        # count the number of ghosts 1-step away
-        features["#-of-ghosts-1-step-away"] = sum((next_x, next_y) in Actions.getLegalNeighbors(g, walls) for g in ghosts)
 
-        # if there is no danger of ghosts then add the food feature
-        if not features["#-of-ghosts-1-step-away"] and food[next_x][next_y]:
-            features["eats-food"] = 1.0
-
-        dist = closestFood((next_x, next_y), food, walls)
-        if dist is not None:
-            # make the distance a number less than one otherwise the update
-            # will diverge wildly
-            features["closest-food"] = float(dist) / (walls.width * walls.height)
-        features.divideAll(10.0)
-        return features
+        matrix = []
+        for action in actions:
+            # compute the location of pacman after he takes the action
+            dx, dy = Actions.directionToVector(action)
+            next_x, next_y = int(x + dx), int(y + dy)
+
+            # count the number of ghosts 1-step away
+            ghostsNearby = ghostReach.get((next_x, next_y), 0)
+
+            # if there is no danger of ghosts then add the food feature
+            eatsFood = 0.0
+            if not ghostsNearby and food[next_x][next_y]:
+                eatsFood = 1.0
+
+            closestFoodFeature = 0.0
+            dist = state.getClosestFoodDistance((next_x, next_y))
+            if dist is not None:
+                # make the distance a number less than one otherwise the update
+                # will diverge wildly
+                closestFoodFeature = float(dist) / (walls.width * walls.height)
+            features = [1.0, ghostsNearby, eatsFood, closestFoodFeature]
+            matrix.append([value / 10.0 for value in features])
+        return matrix
 
         
 class NewExtractor(FeatureExtractor):
@@ -108,27 +158,6 @@ class NewExtractor(FeatureExtractor):
     Design you own feature extractor here. You may define other helper functions you find necessary.
     """
 
-    def closestGhost(self, pos, ghost, walls):
-        """
-        closestGhost -- this is similar to the function that we have
-        worked on in the search project; here its all in one place
-        """
-        fringe = [(pos[0], pos[1], 0)]
-        expanded = set()
-        while fringe:
-            pos_x, pos_y, dist = fringe.pop(0)
-            if (pos_x, pos_y) in expanded:
-                continue
-            expanded.add((pos_x, pos_y))
-            # if we find a ghost at this location then exit
-            if ghost == (pos_x, pos_y):
-                return dist
-            # otherwise spread out from the location to its neighbours
-            nbrs = Actions.getLegalNeighbors((pos_x, pos_y), walls)
-            for nbr_x, nbr_y in nbrs:
-                fringe.append((nbr_x, nbr_y, dist+1))
-        # no ghost found
-        return None
     """
     Returns simple features for a basic reflex Pacman:
     - whether food will be eaten
@@ -136,57 +165,70 @@ class NewExtractor(FeatureExtractor):
     - whether a ghost collision is imminent
     - whether a ghost is one step away
     """
-    def getFeatures(self, state, action):
+    featureNames = ["bias", "#-of-ghosts-1-step-away", "closest-food", "ghosts-scared",
+                    "eats-food", "#-of-scared-ghosts-1-step-away", "eats-ghost", "closest-ghost"]
+
+    def getFeatureVector(self, state, action):
+        return self.getFeatureMatrix(state, [action])[0]
+
+    def getFeatureMatrix(self, state, actions):
         "*** YOUR CODE HERE ***"
         # extract the grid of food and wall locations and get the ghost locations
         food = state.getFood()
         walls = state.getWalls()
-        ghosts = state.getGhostPositions()
-
-        features = util.Counter()
-        # to properly scale the function values independently of the features
-        features["bias"] = 1.0
-
-        # compute the location of pacman after he takes the action
+        layout = state.data.layout
+        ghostReach = getGhostReach(state.getGhostPositions(), layout)
         x, y = state.getPacmanPosition()
-        dx, dy = Actions.directionToVector(action)
-        next_x, next_y = int(x + dx), int(y + dy)
-
-        # count the number of ghosts 1-step away
-        features["#-of-ghosts-1-step-away"] = sum((next_x, next_y) in Actions.getLegalNeighbors(g, walls) for g in ghosts)
-
-
-        dist = closestFood((next_x, next_y), food, walls)
-        if dist is not None:
-            # make the distance a number less than one otherwise the update
-            # will diverge wildly
-            features["closest-food"] = float(dist) / (walls.width * walls.height)
-
 
         # check if all ghosts are scared
         ghost_states = state.getGhostStates()
         ghosts_scared = all(ghost_state.scaredTimer != 0 for ghost_state in ghost_states)
-        if ghosts_scared:
-            features["ghosts-scared"] = 1.0
-
-        # if there is no danger of ghosts then add the food feature
-        if (not features["#-of-ghosts-1-step-away"] or ghosts_scared) and food[next_x][next_y]:
-            features["eats-food"] = 1.0
-
-        # if scared, check if pacman is in a ghost's scared range
-        if ghosts_scared:
-            for g in state.getGhostStates():
-                if g.scaredTimer !=0 and (next_x, next_y) in Actions.getLegalNeighbors(g.getPosition(), walls):
-                    features["#-of-scared-ghosts-1-step-away"] += 1.0
-                    features["eats-ghost"] = 1.0
-                    dist = self.closestGhost((next_x, next_y), g.getPosition(), walls)
-                    if dist is not None:
-                        # make the distance a number less than one otherwise the update
-                        # will diverge wildly
-                        features["closest-ghost"] = float(dist) / (walls.width * walls.height)
-
-        features.divideAll(10.0)
-        return features
+        # and where the scared ones can be caught
+        scaredGhosts = [(g.getPosition(), layout.getLegalNeighbors(g.getPosition()))
+                        for g in ghost_states if g.scaredTimer != 0]
+
+        matrix = []
+        for action in actions:
+            # compute the location of pacman after he takes the action
+            dx, dy = Actions.directionToVector(action)
+            next_x, next_y = int(x + dx), int(y + dy)
+
+            # count the number of ghosts 1-step away
+            ghostsNearby = ghostReach.get((next_x, next_y), 0)
+
+
+            closestFoodFeature = 0.0
+            dist = state.getClosestFoodDistance((next_x, next_y))
+            if dist is not None:
+                # make the distance a number less than one otherwise the update
+                # will diverge wildly
+                closestFoodFeature = float(dist) / (walls.width * walls.height)
+
+            # if there is no danger of ghosts then add the food feature
+            eatsFood = 0.0
+            if (not ghostsNearby or ghosts_scared) and food[next_x][next_y]:
+                eatsFood = 1.0
+
+            # if scared, check if pacman is in a ghost's scared range
+            scaredGhostsNearby = 0.0
+            eatsGhost = 0.0
+            closestGhostFeature = 0.0
+            if ghosts_scared:
+                for ghostPosition, neighbors in scaredGhosts:
+                    if (next_x, next_y) in neighbors:
+                        scaredGhostsNearby += 1.0
+                        eatsGhost = 1.0
+                        dist = layout.mazeDistance((next_x, next_y), ghostPosition)
+                        if dist is not None:
+                            # make the distance a number less than one otherwise the update
+                            # will diverge wildly
+                            closestGhostFeature = float(dist) / (walls.width * walls.height)
+
+            features = [1.0, ghostsNearby, closestFoodFeature, float(ghosts_scared),
+                        eatsFood, scaredGhostsNearby, eatsGhost, closestGhostFeature]
+            # to properly scale the function values independently of the features
+            matrix.append([value / 10.0 for value in features])
+        return matrix
     
 class NewExtractor2(FeatureExtractor):
     """
@@ -213,90 +255,91 @@ class NewExtractor2(FeatureExtractor):
             if not walls[next_x][next_y]: neighbors.append((next_x, next_y))
         return neighbors
     
-    def closestGhost(self, pos, ghost, walls):
-        """
-        closestGhost -- this is similar to the function that we have
-        worked on in the search project; here its all in one place
-        """
-        fringe = [(pos[0], pos[1], 0)]
-        expanded = set()
-        while fringe:
-            pos_x, pos_y, dist = fringe.pop(0)
-            if (pos_x, pos_y) in expanded:
-                continue
-            expanded.add((pos_x, pos_y))
-            # if we find a ghost at this location then exit
-            if ghost == (pos_x, pos_y):
-                return dist
-            # otherwise spread out from the location to its neighbours
-            nbrs = Actions.getLegalNeighbors((pos_x, pos_y), walls)
-            for nbr_x, nbr_y in nbrs:
-                fringe.append((nbr_x, nbr_y, dist+1))
-        # no ghost found
-        return None
     
-    def getFeatures(self, state, action):
+    featureNames = ["bias", "#-of-ghosts-1-step-away", "#-of-ghosts-2-step-away", "closest-food",
+                    "close-ghost", "#-of-scared-ghosts-1-step-away", "closest-safe-ghost",
+                    "closest-danger-ghost", "eats-food"]
+
+    def getFeatureVector(self, state, action):
+        return self.getFeatureMatrix(state, [action])[0]
+
+    def getFeatureMatrix(self, state, actions):
             # extract the grid of food and wall locations and get the ghost locations
         food = state.getFood()
         walls = state.getWalls()
+        layout = state.data.layout
         ghosts = state.getGhostPositions()
-
-        features = util.Counter()
-
-        features["bias"] = 1.0
-
-        # compute the location of pacman after he takes the action
+        ghostReach = getGhostReach(ghosts, layout)
+        ghostTwoStepReach = {}
+        for g in ghosts:
+            for cell in self.getTwoStepNeighbors(g, walls):
+                ghostTwoStepReach[cell] = ghostTwoStepReach.get(cell, 0) + 1
         x, y = state.getPacmanPosition()
-        dx, dy = Actions.directionToVector(action)
-        next_x, next_y = int(x + dx), int(y + dy)
 
-        # count the number of ghosts 1-step away
-        features["#-of-ghosts-1-step-away"] = sum((next_x, next_y) in Actions.getLegalNeighbors(g, walls) for g in ghosts)
-        
-        # count the number of ghosts 2-step away
-        features["#-of-ghosts-2-step-away"] = sum((next_x, next_y) in self.getTwoStepNeighbors(g, walls) for g in ghosts)
-
-
-        dist = closestFood((next_x, next_y), food, walls)
-        if dist is not None:
-            # make the distance a number less than one otherwise the update
-            # will diverge wildly
-            features["closest-food"] = float(dist) / (walls.width * walls.height)
-            
         # check if all ghosts are scared
         ghost_states = state.getGhostStates()
         all_ghosts_scared = all(ghost_state.scaredTimer >= 2 for ghost_state in ghost_states)
         some_ghosts_scared = any(ghost_state.scaredTimer >= 2 for ghost_state in ghost_states)
-        
-            
-        # if scared, check if pacman is in a ghost's scared range
-        if some_ghosts_scared:
-            for g in ghost_states:
-                if g.scaredTimer >= 2 and util.manhattanDistance((next_x, next_y), g.getPosition()) <= 5:
-                    features["close-ghost"] += 2.0
-                
-                if g.scaredTimer >= 2 and (next_x, next_y) in Actions.getLegalNeighbors(g.getPosition(), walls):
-                    features["#-of-scared-ghosts-1-step-away"] += 1.0
-                    dist = self.closestGhost((next_x, next_y), g.getPosition(), walls)
+        # where the scared ones are and can be caught
+        scaredGhosts = [(g.getPosition(), layout.getLegalNeighbors(g.getPosition()))
+                        for g in ghost_states if g.scaredTimer >= 2]
+        ghostPositions = [g.getPosition() for g in ghost_states]
+
+        matrix = []
+        for action in actions:
+            # compute the location of pacman after he takes the action
+            dx, dy = Actions.directionToVector(action)
+            next_x, next_y = int(x + dx), int(y + dy)
+
+            # count the number of ghosts 1-step away
+            ghostsOneStep = ghostReach.get((next_x, next_y), 0)
+
+            # count the number of ghosts 2-step away
+            ghostsTwoSteps = ghostTwoStepReach.get((next_x, next_y), 0)
+
+
+            closestFoodFeature = 0.0
+            dist = state.getClosestFoodDistance((next_x, next_y))
+            if dist is not None:
+                # make the distance a number less than one otherwise the update
+                # will diverge wildly
+                closestFoodFeature = float(dist) / (walls.width * walls.height)
+
+            # if scared, check if pacman is in a ghost's scared range
+            closeGhost = 0.0
+            scaredGhostsNearby = 0.0
+            closestSafeGhostFeature = 0.0
+            closestDangerGhostFeature = 0.0
+            if some_ghosts_scared:
+                for ghostPosition, neighbors in scaredGhosts:
+                    if util.manhattanDistance((next_x, next_y), ghostPosition) <= 5:
+                        closeGhost += 2.0
+
+                    if (next_x, next_y) in neighbors:
+                        scaredGhostsNearby += 1.0
+                        dist = layout.mazeDistance((next_x, next_y), ghostPosition)
+                        if dist is not None:
+                            # make the distance a number less than one otherwise the update
+                            # will diverge wildly
+                            closestSafeGhostFeature = float(dist) / (walls.width * walls.height)
+            else: 
+                for ghostPosition in ghostPositions:
+                    dist = layout.mazeDistance((next_x, next_y), ghostPosition)
                     if dist is not None:
                         # make the distance a number less than one otherwise the update
                         # will diverge wildly
-                        features["closest-safe-ghost"] = float(dist) / (walls.width * walls.height)
-        else: 
-            for g in ghost_states:
-                dist = self.closestGhost((next_x, next_y), g.getPosition(), walls)
-                if dist is not None:
-                    # make the distance a number less than one otherwise the update
-                    # will diverge wildly
-                    features["closest-danger-ghost"] = float(dist) / (walls.width * walls.height)
-            
-            
-        # if there is no danger of ghosts then add the food feature
-        if (not features["#-of-ghosts-1-step-away"] and not features["#-of-ghosts-2-step-away"] or all_ghosts_scared) and food[next_x][next_y]:
-            features["eats-food"] = 2.0
-            
-        features.divideAll(9.0)
-        return features
+                        closestDangerGhostFeature = float(dist) / (walls.width * walls.height)
+
+
+            # if there is no danger of ghosts then add the food feature
+            eatsFood = 0.0
+            if (not ghostsOneStep and not ghostsTwoSteps or all_ghosts_scared) and food[next_x][next_y]:
+                eatsFood = 2.0
+
+            features = [1.0, ghostsOneStep, ghostsTwoSteps, closestFoodFeature, closeGhost,
+                        scaredGhostsNearby, closestSafeGhostFeature, closestDangerGhostFeature, eatsFood]
+            matrix.append([value / 9.0 for value in features])
+        return matrix
 
     
     
@@ -24,6 +24,9 @@ from util import *
 import time, os
 import traceback
 import sys
+import random
+import collections
+import heapq
 
 #######################
 # Parts worth reading #
@@ -36,6 +39,16 @@ class Agent:
 
     def registerInitialState(self, state): # inspects the starting state
     """
+    # Agents that never modify the states they are handed can set this to
+    # False so that quiet training games (see Game.runFast) give them the
+    # game's own state instead of a deep copy for every observation
+    mutatesObservations = True
+
+    # While a profiled game runs (see Game.timings) this is the game's
+    # util.Timings, so that agents can time their own hot spots, keyed
+    # by (self.index, hook)
+    timings = None
+
     def __init__(self, index=0):
         self.index = index
 
@@ -67,18 +80,31 @@ class Directions:
                WEST: EAST,
                STOP: STOP}
 
-class Configuration:
+class Configuration(object):
     """
     A Configuration holds the (x,y) coordinate of a character, along with its
     traveling direction.
 
     The convention for positions, like a graph, is that (0,0) is the lower left corner, x increases
     horizontally and y increases vertically.  Therefore, north is the direction of increasing y, or (0,1).
+
+    Configurations are immutable and may be shared between game states;
+    generateSuccessor makes new ones.
     """
+    __slots__ = ('pos', 'direction', '_hash')
 
     def __init__(self, pos, direction):
-        self.pos = pos
-        self.direction = direction
+        setattr = object.__setattr__
+        setattr(self, 'pos', pos)
+        # Interned directions compare by identity
+        setattr(self, 'direction', intern(direction))
+        setattr(self, '_hash', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Configurations are immutable')
+
+    def __reduce__(self):
+        return (Configuration, (self.pos, self.direction))
 
     def getPosition(self):
         return (self.pos)
@@ -91,13 +117,18 @@ class Configuration:
         return x == int(x) and y == int(y)
 
     def __eq__(self, other):
-        if other == None: return False
+        if other is None: return False
         return (self.pos == other.pos and self.direction == other.direction)
 
+    def __ne__(self, other):
+        return not self == other
+
     def __hash__(self):
-        x = hash(self.pos)
-        y = hash(self.direction)
-        return hash(x + 13 * y)
+        if self._hash is None:
+            x = hash(self.pos)
+            y = hash(self.direction)
+            object.__setattr__(self, '_hash', hash(x + 13 * y))
+        return self._hash
 
     def __str__(self):
         return "(x,y)="+str(self.pos)+", "+str(self.direction)
@@ -117,18 +148,35 @@ class Configuration:
             direction = self.direction # There is no stop direction
         return Configuration((x + dx, y+dy), direction)
 
-class AgentState:
+class AgentState(object):
     """
     AgentStates hold the state of an agent (configuration, speed, scared, etc).
-    """
 
-    def __init__( self, startConfiguration, isPacman ):
-        self.start = startConfiguration
-        self.configuration = startConfiguration
-        self.isPacman = isPacman
-        self.scaredTimer = 0
-        self.numCarrying = 0
-        self.numReturned = 0
+    AgentStates are immutable and may be shared between game states; use
+    withConfiguration and withScaredTimer to get changed ones.
+    """
+    __slots__ = ('start', 'configuration', 'isPacman', 'scaredTimer',
+                 'numCarrying', 'numReturned', '_hash')
+
+    def __init__( self, startConfiguration, isPacman, configuration=None,
+                  scaredTimer=0, numCarrying=0, numReturned=0 ):
+        if configuration is None:
+            configuration = startConfiguration
+        setattr = object.__setattr__
+        setattr(self, 'start', startConfiguration)
+        setattr(self, 'configuration', configuration)
+        setattr(self, 'isPacman', isPacman)
+        setattr(self, 'scaredTimer', scaredTimer)
+        setattr(self, 'numCarrying', numCarrying)
+        setattr(self, 'numReturned', numReturned)
+        setattr(self, '_hash', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('AgentStates are immutable')
+
+    def __reduce__(self):
+        return (AgentState, (self.start, self.isPacman, self.configuration,
+                             self.scaredTimer, self.numCarrying, self.numReturned))
 
     def __str__( self ):
         if self.isPacman:
@@ -137,20 +185,29 @@ class AgentState:
             return "Ghost: " + str( self.configuration )
 
     def __eq__( self, other ):
-        if other == None:
+        if other is None:
             return False
         return self.configuration == other.configuration and self.scaredTimer == other.scaredTimer
 
+    def __ne__( self, other ):
+        return not self == other
+
     def __hash__(self):
-        return hash(hash(self.configuration) + 13 * hash(self.scaredTimer))
+        if self._hash is None:
+            object.__setattr__(self, '_hash', hash(hash(self.configuration) + 13 * hash(self.scaredTimer)))
+        return self._hash
 
     def copy( self ):
-        state = AgentState( self.start, self.isPacman )
-        state.configuration = self.configuration
-        state.scaredTimer = self.scaredTimer
-        state.numCarrying = self.numCarrying
-        state.numReturned = self.numReturned
-        return state
+        # Nothing can change, so there is nothing to copy
+        return self
+
+    def withConfiguration( self, configuration ):
+        return AgentState( self.start, self.isPacman, configuration,
+                           self.scaredTimer, self.numCarrying, self.numReturned )
+
+    def withScaredTimer( self, scaredTimer ):
+        return AgentState( self.start, self.isPacman, self.configuration,
+                           scaredTimer, self.numCarrying, self.numReturned )
 
     def getPosition(self):
         if self.configuration == None: return None
@@ -274,6 +331,262 @@ class Grid:
                 bools.append(False)
         return bools
 
+class BitGrid(Grid):
+    """
+    A Grid of booleans packed into the bits of a single int, bit
+    x * height + y holding grid[x][y].  It offers the same interface as
+    Grid (grid[x][y] reads and writes, count, asList, packBits, ...), but
+    copying it only copies an int and count() is a popcount, which makes
+    it a cheap representation for food grids that change as Pacman eats.
+    """
+    def __init__(self, width, height, initialValue=False, bitRepresentation=None):
+        if initialValue not in [False, True]: raise Exception('Grids can only contain booleans')
+        self.CELLS_PER_INT = 30
+
+        self.width = width
+        self.height = height
+        self.bits = 0
+        if initialValue:
+            self.bits = (1 << (width * height)) - 1
+        if bitRepresentation:
+            self._unpackBits(bitRepresentation)
+
+    def fromGrid(grid):
+        """
+        Returns a BitGrid holding the same values as grid.
+        """
+        g = BitGrid(grid.width, grid.height)
+        bits = 0
+        bit = 1
+        for column in grid.data:
+            for value in column:
+                if value: bits |= bit
+                bit <<= 1
+        g.bits = bits
+        return g
+    fromGrid = staticmethod(fromGrid)
+
+    def __getitem__(self, x):
+        if x < 0: x += self.width
+        if not 0 <= x < self.width: raise IndexError('grid index out of range')
+        return _BitGridColumn(self, x)
+
+    def __setitem__(self, x, column):
+        for y in range(self.height):
+            self[x][y] = column[y]
+
+    def _getData(self):
+        return [list(self[x]) for x in range(self.width)]
+    data = property(_getData)
+
+    def __str__(self):
+        out = [[str(self[x][y])[0] for x in range(self.width)] for y in range(self.height)]
+        out.reverse()
+        return '\n'.join([''.join(x) for x in out])
+
+    def __eq__(self, other):
+        if other == None: return False
+        if isinstance(other, BitGrid):
+            return self.bits == other.bits and self.height == other.height
+        return self.data == other.data
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        # Same value as Grid.__hash__ for the same contents
+        return hash(self.bits)
+
+    def copy(self):
+        g = BitGrid(self.width, self.height)
+        g.bits = self.bits
+        return g
+
+    def deepCopy(self):
+        return self.copy()
+
+    def shallowCopy(self):
+        # The bits are immutable, so nothing can be shared
+        return self.copy()
+
+    def count(self, item =True ):
+        ones = bin(self.bits).count('1')
+        if item: return ones
+        return self.width * self.height - ones
+
+    def asList(self, key = True):
+        list = []
+        bits = self.bits
+        if not key:
+            bits = ~bits & ((1 << (self.width * self.height)) - 1)
+        height = self.height
+        i = 0
+        while bits:
+            if bits & 1:
+                list.append( (i / height, i % height) )
+            bits >>= 1
+            i += 1
+        return list
+
+class _BitGridColumn(object):
+    """
+    The column grid[x] of a BitGrid; reads and writes go straight to the grid.
+    """
+    __slots__ = ('grid', 'offset', 'height')
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.height = grid.height
+        self.offset = x * grid.height
+
+    def __getitem__(self, y):
+        if y < 0: y += self.height
+        if not 0 <= y < self.height: raise IndexError('grid index out of range')
+        return (self.grid.bits >> (self.offset + y)) & 1 == 1
+
+    def __setitem__(self, y, value):
+        if y < 0: y += self.height
+        if not 0 <= y < self.height: raise IndexError('grid index out of range')
+        if value:
+            self.grid.bits |= 1 << (self.offset + y)
+        else:
+            self.grid.bits &= ~(1 << (self.offset + y))
+
+    def __len__(self):
+        return self.height
+
+class FoodDistanceField:
+    """
+    The maze distance from every cell to its nearest food, found with one
+    breadth first search started from all the food at once.
+
+    A field is computed the first time it is read.  The field of a
+    successor in which Pacman ate a pellet (see withoutFood) is derived
+    from its parent's by only revisiting the cells whose nearest food was
+    the eaten pellet, instead of searching the whole board again.
+    neighbors is the layout's table (see Layout.getNeighborTable).
+    """
+    INFINITY = 1 << 30
+
+    def __init__(self, food, neighbors, base=None, removed=()):
+        self.width = food.width
+        self.height = food.height
+        self.food = food
+        self.neighbors = neighbors
+        self.base = base          # an ancestor whose distances are known
+        self.removed = removed    # pellets eaten since that ancestor
+        self.distances = None
+
+    def withoutFood(self, food, position):
+        """
+        Returns the field for 'food', the food of this field with the pellet
+        at position eaten.
+        """
+        if self.distances is not None:
+            return FoodDistanceField(food, self.neighbors, self, (position,))
+        return FoodDistanceField(food, self.neighbors, self.base, self.removed + (position,))
+
+    def getDistance(self, pos):
+        """
+        Returns the maze distance from pos to the nearest food, or None if
+        no food can be reached from it or pos is not a grid point.
+        """
+        if self.distances is None:
+            self._compute()
+        x, y = pos
+        x_int, y_int = int(x), int(y)
+        if x != x_int or y != y_int: return None
+        if not (0 <= x_int < self.width and 0 <= y_int < self.height): return None
+        dist = self.distances[x_int * self.height + y_int]
+        if dist == FoodDistanceField.INFINITY: return None
+        return dist
+
+    def _compute(self):
+        if self.base is not None:
+            distances = self.base.distances[:]
+            for x, y in self.removed:
+                self._removeSource(distances, x * self.height + y)
+        else:
+            distances = self._search()
+        self.distances = distances
+        self.base = None
+        self.removed = ()
+
+    def _search(self):
+        neighbors = self.neighbors
+        infinity = FoodDistanceField.INFINITY
+        distances = [infinity] * (self.width * self.height)
+        fringe = collections.deque()
+        height = self.height
+        for x, y in self.food.asList():
+            distances[x * height + y] = 0
+            fringe.append(x * height + y)
+        while fringe:
+            cell = fringe.popleft()
+            dist = distances[cell] + 1
+            for nbr in neighbors[cell]:
+                if distances[nbr] == infinity:
+                    distances[nbr] = dist
+                    fringe.append(nbr)
+        return distances
+
+    def _removeSource(self, distances, source):
+        neighbors = self.neighbors
+        infinity = FoodDistanceField.INFINITY
+        if distances[source] != 0: return
+
+        # The cells that may have lost their nearest food are those that
+        # can be reached from it along a path on which the distances grow
+        # by exactly one per step
+        affected = set([source])
+        fringe = collections.deque([source])
+        while fringe:
+            cell = fringe.popleft()
+            dist = distances[cell] + 1
+            for nbr in neighbors[cell]:
+                if nbr not in affected and distances[nbr] == dist:
+                    affected.add(nbr)
+                    fringe.append(nbr)
+
+        # Everything else keeps its distance; the affected cells are
+        # re-solved from the unaffected cells around them
+        for cell in affected:
+            distances[cell] = infinity
+        heap = []
+        for cell in affected:
+            best = infinity
+            for nbr in neighbors[cell]:
+                if nbr not in affected and distances[nbr] + 1 < best:
+                    best = distances[nbr] + 1
+            if best < infinity:
+                distances[cell] = best
+                heapq.heappush(heap, (best, cell))
+        while heap:
+            dist, cell = heapq.heappop(heap)
+            if dist > distances[cell]: continue
+            for nbr in neighbors[cell]:
+                if dist + 1 < distances[nbr]:
+                    distances[nbr] = dist + 1
+                    heapq.heappush(heap, (dist + 1, nbr))
+
+ZOBRIST_KEYS_CACHE = {}
+
+def getZobristKeys(width, height):
+    """
+    Returns a pair of lists holding one random 64 bit key per cell of a
+    width x height board (indexed x * height + y), the first for food and
+    the second for capsules.  The XOR of the keys of the occupied cells
+    identifies a set of cells and can be updated in O(1) when one changes.
+    """
+    if (width, height) not in ZOBRIST_KEYS_CACHE:
+        # A private generator keeps the game's random sequence untouched
+        rand = random.Random(width * 7919 + height)
+        numCells = width * height
+        foodKeys = [rand.getrandbits(64) for i in range(numCells)]
+        capsuleKeys = [rand.getrandbits(64) for i in range(numCells)]
+        ZOBRIST_KEYS_CACHE[(width, height)] = (foodKeys, capsuleKeys)
+    return ZOBRIST_KEYS_CACHE[(width, height)]
+
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1,2)):
         return bitRep
@@ -375,15 +688,29 @@ class GameStateData:
     def __init__( self, prevState = None ):
         """
         Generates a new data packet by copying information from its predecessor.
+
+        The predecessor's AgentStates and capsule list are shared rather
+        than copied: AgentStates are immutable, so the rules replace the
+        entries of agentStates that change, and eatCapsule replaces the
+        list.
         """
         if prevState != None:
             self.food = prevState.food.shallowCopy()
-            self.capsules = prevState.capsules[:]
-            self.agentStates = self.copyAgentStates( prevState.agentStates )
+            self.capsules = prevState.capsules
+            self.agentStates = prevState.agentStates[:]
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
+            self._foodHash = prevState._foodHash
+            self._capsuleHash = prevState._capsuleHash
+            self._foodDistances = prevState._foodDistances
+        else:
+            self._foodHash = None
+            self._capsuleHash = None
+            self._foodDistances = None
 
+        self._hash = None
+        self._compactKey = None
         self._foodEaten = None
         self._foodAdded = None
         self._capsuleEaten = None
@@ -394,8 +721,9 @@ class GameStateData:
 
     def deepCopy( self ):
         state = GameStateData( self )
+        state.capsules = self.capsules[:]
         state.food = self.food.deepCopy()
-        state.layout = self.layout.deepCopy()
+        # Layouts never change, so the copy shares this one
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
         state._foodAdded = self._foodAdded
@@ -423,14 +751,85 @@ class GameStateData:
     def __hash__( self ):
         """
         Allows states to be keys of dictionaries.
+
+        Food and capsules enter through Zobrist hashes that successors
+        inherit and PacmanRules.consume updates (see eatFood and
+        eatCapsule), so hashing never scans the board.  The result is
+        cached; states must not change once they have been hashed.
+        """
+        if self._hash is None:
+            if self._foodHash is None:
+                self._foodHash = self._zobristHash(self.food.asList(), 0)
+            if self._capsuleHash is None:
+                self._capsuleHash = self._zobristHash(self.capsules, 1)
+            self._hash = hash((tuple(self.agentStates), self._foodHash ^ self._capsuleHash, self.score))
+        return self._hash
+
+    def getCompactKey( self ):
+        """
+        Returns a small tuple of plain values that is equal for two
+        states exactly when the states are equal: every agent's
+        position, direction and scared timer, the food bits, the
+        capsules and the score.  Unlike the state itself it keeps no
+        grids or agent states alive, which makes it the better key for
+        tables that remember many states.  Cached like the hash.
+        """
+        if self._compactKey is None:
+            agents = []
+            for agentState in self.agentStates:
+                configuration = agentState.configuration
+                if configuration is None:
+                    agents.append((None, agentState.scaredTimer))
+                else:
+                    agents.append((configuration.pos, configuration.direction, agentState.scaredTimer))
+            food = self.food
+            if isinstance(food, BitGrid):
+                foodKey = (food.height, food.bits)
+            else:
+                foodKey = food.packBits()
+            self._compactKey = (tuple(agents), foodKey, tuple(self.capsules), self.score)
+        return self._compactKey
+
+    def _zobristHash( self, positions, table ):
+        keys = getZobristKeys(self.food.width, self.food.height)[table]
+        height = self.food.height
+        h = 0
+        for x, y in positions:
+            h ^= keys[x * height + y]
+        return h
+
+    def eatFood( self, position ):
+        """
+        Removes the food at position, which must hold food, keeping the
+        state's hash up to date.
+        """
+        x, y = position
+        self.food = self.food.copy()
+        self.food[x][y] = False
+        if self._foodHash is not None:
+            self._foodHash ^= self._zobristHash([position], 0)
+        if self._foodDistances is not None:
+            self._foodDistances = self._foodDistances.withoutFood(self.food, position)
+
+    def getClosestFoodDistance( self, pos ):
+        """
+        Returns the maze distance from pos to the nearest food (None if
+        there is none).  The distance field behind it is created on the
+        first call and then follows the state's successors.
         """
-        for i, state in enumerate( self.agentStates ):
-            try:
-                int(hash(state))
-            except TypeError, e:
-                print e
-                #hash(state)
-        return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113* hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575 )
+        if self._foodDistances is None:
+            self._foodDistances = FoodDistanceField(self.food, self.layout.getNeighborTable())
+        return self._foodDistances.getDistance(pos)
+
+    def eatCapsule( self, position ):
+        """
+        Removes the capsule at position, keeping the state's hash up to date.
+        """
+        # The list may be shared with other states
+        self.capsules = self.capsules[:]
+        self.capsules.remove( position )
+        if self._capsuleHash is not None:
+            self._capsuleHash ^= self._zobristHash([position], 1)
 
     def __str__( self ):
         width, height = self.layout.width, self.layout.height
@@ -488,12 +887,14 @@ class GameStateData:
         """
         Creates an initial game state from a layout array (see layout.py).
         """
-        self.food = layout.food.copy()
+        self.food = BitGrid.fromGrid(layout.food)
         #self.capsules = []
         self.capsules = layout.capsules[:]
         self.layout = layout
         self.score = 0
         self.scoreChange = 0
+        self._foodHash = self._zobristHash(self.food.asList(), 0)
+        self._capsuleHash = self._zobristHash(self.capsules, 1)
 
         self.agentStates = []
         numGhosts = 0
@@ -530,6 +931,13 @@ class Game:
         self.agentTimeout = False
         import cStringIO
         self.agentOutput = [cStringIO.StringIO() for agent in agents]
+        # Set to a util.Timings to profile the game: it then collects the
+        # seconds spent in each agent's observationFunction and getAction,
+        # in generateSuccessor, and in whatever agents time themselves
+        self.timings = None
+        # Set to a recording.RecordingWriter to have every move appended
+        # to a recording as it is made
+        self.recorder = None
 
     def getProgress(self):
         if self.gameOver:
@@ -564,12 +972,20 @@ class Game:
         sys.stderr = OLD_STDERR
 
 
+    def _shareTimings(self):
+        "Hands self.timings to the agents (see Agent.timings)"
+        for agent in self.agents:
+            if agent and getattr(agent, 'timings', None) is not self.timings:
+                agent.timings = self.timings
+
     def run( self ):
         """
         Main control loop for game play.
         """
         self.display.initialize(self.state.data)
         self.numMoves = 0
+        self._shareTimings()
+        timings = self.timings
 
         ###self.display.initialize(self.state.makeObservation(1).data)
         # inform learning agents of the game start
@@ -616,12 +1032,18 @@ class Game:
             agent = self.agents[agentIndex]
             move_time = 0
             skip_action = False
+            getAction = agent.getAction
+            if timings is not None:
+                getAction = timings.timed((agentIndex, 'getAction'), getAction)
             # Generate an observation of the state
             if 'observationFunction' in dir( agent ):
+                observationFunction = agent.observationFunction
+                if timings is not None:
+                    observationFunction = timings.timed((agentIndex, 'observationFunction'), observationFunction)
                 self.mute(agentIndex)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.observationFunction, int(self.rules.getMoveTimeout(agentIndex)))
+                        timed_func = TimeoutFunction(observationFunction, int(self.rules.getMoveTimeout(agentIndex)))
                         try:
                             start_time = time.time()
                             observation = timed_func(self.state.deepCopy())
@@ -634,7 +1056,7 @@ class Game:
                         self.unmute()
                         return
                 else:
-                    observation = agent.observationFunction(self.state.deepCopy())
+                    observation = observationFunction(self.state.deepCopy())
                 self.unmute()
             else:
                 observation = self.state.deepCopy()
@@ -644,7 +1066,7 @@ class Game:
             self.mute(agentIndex)
             if self.catchExceptions:
                 try:
-                    timed_func = TimeoutFunction(agent.getAction, int(self.rules.getMoveTimeout(agentIndex)) - int(move_time))
+                    timed_func = TimeoutFunction(getAction, int(self.rules.getMoveTimeout(agentIndex)) - int(move_time))
                     try:
                         start_time = time.time()
                         if skip_action:
@@ -683,11 +1105,15 @@ class Game:
                     self.unmute()
                     return
             else:
-                action = agent.getAction(observation)
+                action = getAction(observation)
             self.unmute()
 
             # Execute the action
             self.moveHistory.append( (agentIndex, action) )
+            if self.recorder is not None:
+                self.recorder.recordMove( agentIndex, action )
+            if timings is not None:
+                start_time = time.time()
             if self.catchExceptions:
                 try:
                     self.state = self.state.generateSuccessor( agentIndex, action )
@@ -698,6 +1124,8 @@ class Game:
                     return
             else:
                 self.state = self.state.generateSuccessor( agentIndex, action )
+            if timings is not None:
+                timings.add((agentIndex, 'generateSuccessor'), time.time() - start_time)
 
             # Change the display
             self.display.update( self.state.data )
@@ -727,3 +1155,82 @@ class Game:
                     self.unmute()
                     return
         self.display.finish()
+
+    def runFast( self ):
+        """
+        Control loop for quiet training games.  Plays exactly like run()
+        without catchExceptions or muteAgents, but looks up the agents'
+        optional methods once per game instead of once per move, never
+        swaps stdout, and only deep copies observations for agents that
+        may modify them (see Agent.mutatesObservations).
+        """
+        self.display.initialize(self.state.data)
+        self.numMoves = 0
+        self._shareTimings()
+        timings = self.timings
+
+        observers = []
+        actors = []
+        copiers = []
+        for i in range(len(self.agents)):
+            agent = self.agents[i]
+            if not agent:
+                # this is a null agent, meaning it failed to load
+                print >>sys.stderr, "Agent %d failed to load" % i
+                self._agentCrash(i, quiet=True)
+                return
+            copies = getattr(agent, 'mutatesObservations', True)
+            register = getattr(agent, 'registerInitialState', None)
+            if register is not None:
+                if copies: register(self.state.deepCopy())
+                else: register(self.state)
+            observe = getattr(agent, 'observationFunction', None)
+            act = agent.getAction
+            if timings is not None:
+                if observe is not None:
+                    observe = timings.timed((i, 'observationFunction'), observe)
+                act = timings.timed((i, 'getAction'), act)
+            observers.append(observe)
+            actors.append(act)
+            copiers.append(copies)
+
+        agentIndex = self.startingIndex
+        numAgents = len( self.agents )
+        moveHistory = self.moveHistory
+        recorder = self.recorder
+        display = self.display
+        rules = self.rules
+
+        while not self.gameOver:
+            # Generate an observation of the state
+            state = self.state
+            if copiers[agentIndex]:
+                observation = state.deepCopy()
+            else:
+                observation = state
+            observe = observers[agentIndex]
+            if observe is not None:
+                observation = observe(observation)
+
+            # Solicit and execute an action
+            action = actors[agentIndex](observation)
+            moveHistory.append( (agentIndex, action) )
+            if recorder is not None:
+                recorder.recordMove( agentIndex, action )
+            if timings is None:
+                self.state = state.generateSuccessor( agentIndex, action )
+            else:
+                start = time.time()
+                self.state = state.generateSuccessor( agentIndex, action )
+                timings.add((agentIndex, 'generateSuccessor'), time.time() - start)
+
+            display.update( self.state.data )
+            rules.process(self.state, self)
+            agentIndex = ( agentIndex + 1 ) % numAgents
+
+        # inform a learning agent of the game result
+        for agent in self.agents:
+            final = getattr(agent, 'final', None)
+            if final is not None:
+                final( self.state )
+        display.finish()
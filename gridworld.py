@@ -163,13 +163,52 @@ class Gridworld(mdp.MarkovDecisionProcess):
         return successors
 
     def __aggregate(self, statesAndProbs):
-        counter = util.Counter()
+        # A plain dict sums and orders the pairs exactly as util.Counter
+        # did, without its per-access overhead
+        probs = {}
         for state, prob in statesAndProbs:
-            counter[state] += prob
-        newStatesAndProbs = []
-        for state, prob in counter.items():
-            newStatesAndProbs.append((state, prob))
-        return newStatesAndProbs
+            probs[state] = probs.get(state, 0) + prob
+        return probs.items()
+
+    def getTransitionArrays(self):
+        """
+        Builds the same arrays as MarkovDecisionProcess.getTransitionArrays
+        straight from the grid, looking up each state's neighbors once
+        rather than once per transition.
+        """
+        states = self.getStates()
+        arrays = mdp.TransitionArrays(states)
+        stateIndex = arrays.stateIndex
+        terminal = stateIndex[self.grid.terminalState]
+        moveProb, sideProb = 1-self.noise, self.noise/2.0
+        for state in states:
+            if self.isTerminal(state):
+                arrays.endState()
+                continue
+            x, y = state
+            cell = self.grid[x][y]
+            if type(cell) == int or type(cell) == float:
+                for action in self.getPossibleActions(state):
+                    arrays.addRow(action, [terminal], [1.0], [cell])
+                arrays.endState()
+                continue
+            northState = (x,y+1) in stateIndex and (x,y+1) or state
+            westState = (x-1,y) in stateIndex and (x-1,y) or state
+            southState = (x,y-1) in stateIndex and (x,y-1) or state
+            eastState = (x+1,y) in stateIndex and (x+1,y) or state
+            # Same successors, in the same order, as getTransitionStatesAndProbs
+            moves = {'north': [(northState, moveProb), (westState, sideProb), (eastState, sideProb)],
+                     'south': [(southState, moveProb), (westState, sideProb), (eastState, sideProb)],
+                     'west': [(westState, moveProb), (northState, sideProb), (southState, sideProb)],
+                     'east': [(eastState, moveProb), (northState, sideProb), (southState, sideProb)]}
+            for action in self.getPossibleActions(state):
+                successors = self.__aggregate(moves[action])
+                arrays.addRow(action,
+                              [stateIndex[nextState] for nextState, prob in successors],
+                              [prob for nextState, prob in successors],
+                              [self.livingReward] * len(successors))
+            arrays.endState()
+        return arrays
 
     def __isAllowed(self, y, x):
         if y < 0 or y >= self.grid.height: return False
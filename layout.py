@@ -14,14 +14,104 @@
 
 from util import manhattanDistance
 from game import Grid
+from array import array
+import collections
 import os
 import random
 
 VISIBILITY_MATRIX_CACHE = {}
+MAZE_DISTANCE_CACHE = {}
+LAYOUT_CACHE = {}
+
+UNREACHABLE = 0xFFFF
+
+class MazeDistances:
+    """
+    Shortest path lengths between every pair of open cells of a layout,
+    found with one breadth first search per cell.  Cells are numbered in
+    column order; the distance between cells i and j is stored at
+    i * numCells + j in a flat unsigned short array.  The searches follow
+    the neighbors of the layout's MoveTables.
+    """
+    def __init__(self, walls, moveTables):
+        self.width = walls.width
+        self.height = walls.height
+        self.cellIndex = [-1] * (self.width * self.height)
+        self.cells = walls.asList(False)
+        for i, (x, y) in enumerate(self.cells):
+            self.cellIndex[x * self.height + y] = i
+        neighbors = [[self.cellIndex[nx * self.height + ny] for nx, ny in moveTables.neighbors[cell]]
+                     for cell in self.cells]
+
+        numCells = len(self.cells)
+        self.numCells = numCells
+        self.distances = array('H', [UNREACHABLE]) * (numCells * numCells)
+        distances = self.distances
+        for source in range(numCells):
+            row = source * numCells
+            distances[row + source] = 0
+            fringe = collections.deque([source])
+            while fringe:
+                cell = fringe.popleft()
+                dist = distances[row + cell] + 1
+                for nbr in neighbors[cell]:
+                    if distances[row + nbr] == UNREACHABLE:
+                        distances[row + nbr] = dist
+                        fringe.append(nbr)
+
+    def getCell(self, pos):
+        """
+        Returns the index of the open cell at pos, or -1 if pos is a wall,
+        off the board or between grid points.
+        """
+        x, y = pos
+        x_int, y_int = int(x), int(y)
+        if x != x_int or y != y_int: return -1
+        if not (0 <= x_int < self.width and 0 <= y_int < self.height): return -1
+        return self.cellIndex[x_int * self.height + y_int]
+
+    def getDistance(self, pos1, pos2):
+        i, j = self.getCell(pos1), self.getCell(pos2)
+        if i < 0 or j < 0: return None
+        dist = self.distances[i * self.numCells + j]
+        if dist == UNREACHABLE: return None
+        return dist
+
+class MoveTables:
+    """
+    The moves from every open grid point of a layout, worked out once:
+    the actions Actions.getPossibleActions allows there, the cells
+    Actions.getLegalNeighbors returns, and the actions a ghost heading in
+    each direction may take (see GhostRules.getLegalActions).  Entries
+    are tuples in the order the Actions functions list them, keyed by
+    (x, y) and by ((x, y), direction) respectively.
+    """
+    def __init__(self, walls):
+        from game import Actions, Configuration, Directions
+        self.possibleActions = {}
+        self.neighbors = {}
+        self.ghostActions = {}
+        for pos in walls.asList(False):
+            actions = Actions.getPossibleActions(Configuration(pos, Directions.STOP), walls)
+            self.possibleActions[pos] = tuple(actions)
+            self.neighbors[pos] = tuple(Actions.getLegalNeighbors(pos, walls))
+            moves = [action for action in actions if action != Directions.STOP]
+            for direction in Actions._directions:
+                legal = moves[:]
+                reverse = Actions.reverseDirection(direction)
+                if reverse in legal and len(legal) > 1:
+                    legal.remove(reverse)
+                self.ghostActions[(pos, direction)] = tuple(legal)
 
 class Layout:
     """
     A Layout manages the static information about the game board.
+
+    Layouts are not modified once built, so game states share theirs
+    rather than copying it (deepCopy returns the layout itself).  The
+    layouts getLayout and internLayout return are also shared by every
+    caller asking for the same text; use mutableCopy to get one of your
+    own to change.
     """
 
     def __init__(self, layoutText):
@@ -35,6 +125,9 @@ class Layout:
         self.processLayoutText(layoutText)
         self.layoutText = layoutText
         self.totalFood = len(self.food.asList())
+        self.mazeDistances = None
+        self.moveTables = None
+        self.neighborTable = None
         # self.initializeVisibilityMatrix()
 
     def getNumGhosts(self):
@@ -61,6 +154,81 @@ class Layout:
         else:
             self.visibility = VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)]
 
+    def initializeMazeDistances(self):
+        global MAZE_DISTANCE_CACHE
+        key = '\n'.join(self.layoutText)
+        if key not in MAZE_DISTANCE_CACHE:
+            MAZE_DISTANCE_CACHE[key] = MazeDistances(self.walls, self.getMoveTables())
+        self.mazeDistances = MAZE_DISTANCE_CACHE[key]
+
+    def mazeDistance(self, pos1, pos2):
+        """
+        Returns the length of the shortest path between two grid points,
+        or None if there is none (walls, off-grid positions such as those
+        of slowed ghosts, or unconnected regions).  The table behind it is
+        built on first use and shared by all layouts with the same text.
+        """
+        if self.mazeDistances is None:
+            self.initializeMazeDistances()
+        return self.mazeDistances.getDistance(pos1, pos2)
+
+    def getMoveTables(self):
+        """
+        Returns the layout's MoveTables, built on first use.  Changing the
+        walls of a mutableCopy afterwards leaves them out of date.
+        """
+        if self.moveTables is None:
+            self.moveTables = MoveTables(self.walls)
+        return self.moveTables
+
+    def getNeighborTable(self):
+        """
+        Returns a list holding, for each cell index x * height + y, the cell
+        indices of its legal neighbors (from the MoveTables); wall cells
+        have no neighbors.  Built on first use, like getMoveTables.
+        """
+        if self.neighborTable is None:
+            height = self.height
+            table = [()] * (self.width * height)
+            for (x, y), neighbors in self.getMoveTables().neighbors.items():
+                table[x * height + y] = tuple([nx * height + ny for nx, ny in neighbors])
+            self.neighborTable = table
+        return self.neighborTable
+
+    def getPossibleActions(self, config):
+        """
+        Same as Actions.getPossibleActions(config, self.walls)
+        """
+        tables = self.moveTables or self.getMoveTables()
+        actions = tables.possibleActions.get(config.pos)
+        if actions is None:
+            # between grid points
+            from game import Actions
+            return Actions.getPossibleActions(config, self.walls)
+        return list(actions)
+
+    def getLegalNeighbors(self, position):
+        """
+        Same as Actions.getLegalNeighbors(position, self.walls)
+        """
+        tables = self.moveTables or self.getMoveTables()
+        neighbors = tables.neighbors.get(position)
+        if neighbors is None:
+            from game import Actions
+            return Actions.getLegalNeighbors(position, self.walls)
+        return list(neighbors)
+
+    def getGhostActions(self, config):
+        """
+        The actions of GhostRules.getLegalActions for a ghost at config, or
+        None if it is between grid points
+        """
+        tables = self.moveTables or self.getMoveTables()
+        actions = tables.ghostActions.get((config.pos, config.direction))
+        if actions is None:
+            return None
+        return list(actions)
+
     def isWall(self, pos):
         x, col = pos
         return self.walls[x][col]
@@ -90,6 +258,13 @@ class Layout:
         return "\n".join(self.layoutText)
 
     def deepCopy(self):
+        # Nothing changes a layout, so there is nothing to copy
+        return self
+
+    def mutableCopy(self):
+        """
+        Returns a new layout with the same text, which the caller may change
+        """
         return Layout(self.layoutText[:])
 
     def processLayoutText(self, layoutText):
@@ -128,6 +303,17 @@ class Layout:
         elif layoutChar in  ['1', '2', '3', '4']:
             self.agentPositions.append( (int(layoutChar), (x,y)))
             self.numGhosts += 1
+
+def internLayout(layoutText):
+    """
+    Returns the shared Layout for the list of lines layoutText, parsing it
+    only the first time that text is seen
+    """
+    key = '\n'.join(layoutText)
+    if key not in LAYOUT_CACHE:
+        LAYOUT_CACHE[key] = Layout(list(layoutText))
+    return LAYOUT_CACHE[key]
+
 def getLayout(name, back = 2):
     if name.endswith('.lay'):
         layout = tryToLoad('layouts/' + name)
@@ -145,5 +331,5 @@ def getLayout(name, back = 2):
 def tryToLoad(fullname):
     if(not os.path.exists(fullname)): return None
     f = open(fullname)
-    try: return Layout([line.strip() for line in f])
+    try: return internLayout([line.strip() for line in f])
     finally: f.close()
@@ -14,7 +14,100 @@
 
 from game import Directions, Agent, Actions
 
-import random,util,time
+import random,util,time,os,cPickle,array
+
+# Prioritized replay draws transitions with probability proportional to
+# (|TD error| + PRIORITY_EPSILON) ** PRIORITY_EXPONENT and corrects for
+# the bias with importance weights (N * P(i)) ** -IMPORTANCE_EXPONENT
+PRIORITY_EXPONENT = 0.6
+PRIORITY_EPSILON = 0.01
+IMPORTANCE_EXPONENT = 0.4
+
+class ReplayBuffer:
+    """
+      The last capacity transitions an agent observed, kept in a ring
+      and drawn again uniformly or, if prioritized, by TD error (with a
+      sum tree, so drawing and reprioritizing take O(log capacity)).
+      Transitions are whatever the agent's encodeTransition returns.
+    """
+    def __init__(self, capacity, prioritized=False):
+        if capacity < 1:
+            raise Exception('A replay buffer needs room for at least one transition')
+        self.capacity = capacity
+        self.transitions = [None] * capacity
+        self.next = 0
+        self.size = 0
+        self.prioritized = prioritized
+        if prioritized:
+            # Node i holds the sum of its children 2i and 2i+1; the
+            # priority of transition j is at leaf capacity + j
+            self.tree = array.array('d', [0.0]) * (2 * capacity)
+            self.maxPriority = 1.0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, transition):
+        """
+          Stores transition, replacing the oldest one once full.  New
+          transitions get the highest priority seen so far.
+        """
+        i = self.next
+        self.transitions[i] = transition
+        if self.prioritized:
+            self._setPriority(i, self.maxPriority)
+        self.next = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def sample(self, n):
+        """
+          Draws n transitions, with replacement, as a list of
+          (index, transition, weight).  Weights are 1.0 unless the
+          buffer is prioritized, and then at most 1.0.
+        """
+        if not self.prioritized:
+            size = self.size
+            return [(i, self.transitions[i], 1.0)
+                    for i in [int(random.random() * size) for k in range(n)]]
+        tree, capacity = self.tree, self.capacity
+        total = tree[1]
+        # one draw from each of n equal slices of the total priority
+        segment = total / n
+        indices = []
+        for k in range(n):
+            mass = min((k + random.random()) * segment, total)
+            node = 1
+            while node < capacity:
+                node *= 2
+                if mass > tree[node]:
+                    mass -= tree[node]
+                    node += 1
+            indices.append(min(node - capacity, self.size - 1))
+        weights = [(self.size * tree[capacity + i] / total) ** -IMPORTANCE_EXPONENT for i in indices]
+        maxWeight = max(weights)
+        return [(i, self.transitions[i], weight / maxWeight) for i, weight in zip(indices, weights)]
+
+    def updatePriority(self, index, error):
+        """
+          Sets the priority of a prioritized buffer's transition from its
+          latest TD error
+        """
+        if self.prioritized:
+            priority = (abs(error) + PRIORITY_EPSILON) ** PRIORITY_EXPONENT
+            self.maxPriority = max(self.maxPriority, priority)
+            self._setPriority(index, priority)
+
+    def _setPriority(self, index, priority):
+        tree = self.tree
+        node = self.capacity + index
+        change = priority - tree[node]
+        while node >= 1:
+            tree[node] += change
+            node //= 2
+
+def getLegalActions(state):
+    "The default actionFn; a function rather than a lambda so that agents can be pickled"
+    return state.getLegalActions()
 
 class ValueEstimationAgent(Agent):
     """
@@ -98,6 +191,9 @@ class ReinforcementAgent(ValueEstimationAgent):
         - Use self.getLegalActions(state) to know which actions
                       are available in a state
     """
+    # Observations are only remembered, never modified
+    mutatesObservations = False
+
     ####################################
     #    Override These Functions      #
     ####################################
@@ -109,10 +205,112 @@ class ReinforcementAgent(ValueEstimationAgent):
         """
         util.raiseNotDefined()
 
+    def getLearnedParameters(self):
+        """
+          Returns a picklable dict holding everything the agent has
+          learned so far (Q-values, weights, ...).  Missing keys are
+          assumed to be 0.0.  The dict may be the agent's live copy,
+          so callers should not modify it.
+        """
+        util.raiseNotDefined()
+
+    def setLearnedParameters(self, parameters):
+        """
+          Replaces what the agent has learned with a dict
+          previously returned by getLearnedParameters
+        """
+        util.raiseNotDefined()
+
+    def updateLearnedParameters(self, changes):
+        """
+          Overwrites just the entries in the dict changes, keeping
+          the rest of what the agent has learned
+        """
+        parameters = dict(self.getLearnedParameters())
+        parameters.update(changes)
+        self.setLearnedParameters(parameters)
+
+    def trackLearnedParameters(self):
+        """
+          Starts noting which learned parameters change, for
+          getChangedParameters and revertChangedParameters
+        """
+        self.trackedParameters = dict(self.getLearnedParameters())
+
+    def getChangedParameters(self):
+        """
+          Returns a dict of the entries changed since
+          trackLearnedParameters, with their new values
+        """
+        tracked = self.trackedParameters
+        return dict([(key, value) for key, value in self.getLearnedParameters().items()
+                     if tracked.get(key, 0.0) != value])
+
+    def revertChangedParameters(self):
+        """
+          Puts back the values the changed entries had when
+          trackLearnedParameters was called
+        """
+        tracked = self.trackedParameters
+        self.updateLearnedParameters(dict([(key, tracked.get(key, 0.0)) for key in self.getChangedParameters()]))
+
+    def encodeTransition(self, state, action, nextState, reward):
+        """
+          Returns what the replay buffer should keep of a transition.
+          Agents can keep less than the states, as long as their
+          replayTransition understands it.
+        """
+        return (state, action, nextState, reward)
+
+    def replayTransition(self, transition, weight=1.0):
+        """
+          Learns from a transition kept by encodeTransition once more,
+          with the learning rate scaled by weight.  Returns the TD error,
+          or None if it is not known.
+        """
+        alpha = self.alpha
+        self.alpha = alpha * weight
+        try:
+            self.update(*transition)
+        finally:
+            self.alpha = alpha
+        return None
+
     ####################################
     #    Read These Functions          #
     ####################################
 
+    def mergeLearnedParameters(self, base, learned):
+        """
+          Combines parameter dicts learned independently, starting
+          from the common snapshot 'base', by several copies of this
+          agent (see runParallelTraining in pacman.py).  Returns
+          the merged values of the entries somebody changed; the rest
+          keep their base value.  'learned' dicts may omit unchanged
+          entries, and base may be the live getLearnedParameters().
+        """
+        deltas = util.Counter()
+        touched = util.Counter()
+        for parameters in learned:
+            for key, value in parameters.items():
+                delta = value - base.get(key, 0.0)
+                if delta != 0:
+                    deltas[key] += delta
+                    touched[key] += 1
+        merged = {}
+        for key in deltas:
+            # k copies that each pulled the entry a fraction alpha of the
+            # way to their own target are combined as if their updates had
+            # been applied one after the other: 1 - (1 - alpha)^k of the way
+            # to the average target
+            k = touched[key]
+            if 0 < self.alpha < 1:
+                scale = (1 - (1 - self.alpha) ** k) / self.alpha
+            else:
+                scale = 1.0
+            merged[key] = base.get(key, 0.0) + scale * deltas[key] / k
+        return merged
+
     def getLegalActions(self,state):
         """
           Get the actions available for a given
@@ -130,7 +328,31 @@ class ReinforcementAgent(ValueEstimationAgent):
             NOTE: Do *not* override or call this function
         """
         self.episodeRewards += deltaReward
-        self.update(state,action,nextState,deltaReward)
+        if self.timings is None:
+            self.update(state,action,nextState,deltaReward)
+        else:
+            start = time.time()
+            self.update(state,action,nextState,deltaReward)
+            self.timings.add((self.index, 'update'), time.time() - start)
+        if self.replayBuffer is not None and self.isInTraining():
+            self.learnFromReplay(state,action,nextState,deltaReward)
+
+    def learnFromReplay(self, state, action, nextState, reward):
+        """
+          Adds a transition to the replay buffer and learns from a
+          mini-batch of replayBatch transitions drawn from it
+        """
+        if self.timings is not None:
+            start = time.time()
+        buffer = self.replayBuffer
+        buffer.add(self.encodeTransition(state, action, nextState, reward))
+        if len(buffer) >= self.replayBatch:
+            for index, transition, weight in buffer.sample(self.replayBatch):
+                error = self.replayTransition(transition, weight)
+                if error is not None:
+                    buffer.updatePriority(index, error)
+        if self.timings is not None:
+            self.timings.add((self.index, 'replay'), time.time() - start)
 
     def startEpisode(self):
         """
@@ -153,6 +375,61 @@ class ReinforcementAgent(ValueEstimationAgent):
             # Take off the training wheels
             self.epsilon = 0.0    # no exploration
             self.alpha = 0.0      # no learning
+        if self.checkpointEvery > 0 and self.episodesSoFar <= self.numTraining:
+            if self.episodesSoFar % self.checkpointEvery == 0 or self.episodesSoFar == self.numTraining:
+                self.saveCheckpoint()
+
+    def saveCheckpoint(self, path=None):
+        """
+          Writes what the agent has learned, its episode counters, epsilon,
+          alpha and the state of the random module to path (default
+          self.checkpointPath).  The file is replaced atomically, so an
+          interrupted run always leaves the previous checkpoint intact.
+        """
+        if path == None:
+            path = self.checkpointPath
+        checkpoint = {'agent': self.__class__.__name__,
+                      'parameters': self.getLearnedParameters(),
+                      'episodesSoFar': self.episodesSoFar,
+                      'numTraining': self.numTraining,
+                      'accumTrainRewards': self.accumTrainRewards,
+                      'accumTestRewards': self.accumTestRewards,
+                      'epsilon': self.epsilon,
+                      'alpha': self.alpha,
+                      'randomState': random.getstate()}
+        tmpPath = path + '.tmp'
+        f = open(tmpPath, 'wb')
+        try:
+            cPickle.dump(checkpoint, f, cPickle.HIGHEST_PROTOCOL)
+        finally:
+            f.close()
+        os.rename(tmpPath, path)
+
+    def loadCheckpoint(self, path):
+        """
+          Restores an agent saved by saveCheckpoint.  Training resumes
+          after the episodes the checkpoint already covers, with the
+          checkpoint's epsilon and alpha if it was saved mid-training.
+        """
+        f = open(path, 'rb')
+        try:
+            checkpoint = cPickle.load(f)
+        finally:
+            f.close()
+        if checkpoint['agent'] != self.__class__.__name__:
+            raise Exception('Checkpoint %s was saved by agent %s, not %s' % (path, checkpoint['agent'], self.__class__.__name__))
+        self.setLearnedParameters(checkpoint['parameters'])
+        self.episodesSoFar = checkpoint['episodesSoFar']
+        self.accumTrainRewards = checkpoint['accumTrainRewards']
+        self.accumTestRewards = checkpoint['accumTestRewards']
+        if checkpoint['episodesSoFar'] < checkpoint['numTraining']:
+            # otherwise they were switched off when its training ended
+            self.epsilon = checkpoint['epsilon']
+            self.alpha = checkpoint['alpha']
+        random.setstate(checkpoint['randomState'])
+        if self.episodesSoFar >= self.numTraining:
+            self.epsilon = 0.0
+            self.alpha = 0.0
 
     def isInTraining(self):
         return self.episodesSoFar < self.numTraining
@@ -160,7 +437,9 @@ class ReinforcementAgent(ValueEstimationAgent):
     def isInTesting(self):
         return not self.isInTraining()
 
-    def __init__(self, actionFn = None, numTraining=100, epsilon=0.5, alpha=0.5, gamma=1):
+    def __init__(self, actionFn = None, numTraining=100, epsilon=0.5, alpha=0.5, gamma=1,
+                 checkpointEvery=0, checkpointPath='checkpoint.pkl', loadCheckpoint=None,
+                 replay=None, replaySize=10000, replayBatch=16):
         """
         actionFn: Function which takes a state and returns the list of legal actions
 
@@ -168,9 +447,20 @@ class ReinforcementAgent(ValueEstimationAgent):
         epsilon  - exploration rate
         gamma    - discount factor
         numTraining - number of training episodes, i.e. no learning after these many episodes
+        checkpointEvery - save a checkpoint every this many training episodes
+                          and when training ends (0 never saves)
+        checkpointPath  - where checkpoints are saved
+        loadCheckpoint  - checkpoint file to resume from
+        replay      - 'uniform' or 'prioritized' to learn from past transitions
+                      too (experience replay); None learns from each only once
+        replaySize  - number of past transitions remembered for replay
+        replayBatch - transitions replayed after each one observed in training
+
+        Subclasses must set up whatever setLearnedParameters fills in
+        before calling this, as loading a checkpoint happens here.
         """
         if actionFn == None:
-            actionFn = lambda state: state.getLegalActions()
+            actionFn = getLegalActions
         self.actionFn = actionFn
         self.episodesSoFar = 0
         self.accumTrainRewards = 0.0
@@ -179,6 +469,18 @@ class ReinforcementAgent(ValueEstimationAgent):
         self.epsilon = float(epsilon)
         self.alpha = float(alpha)
         self.discount = float(gamma)
+        self.checkpointEvery = int(checkpointEvery)
+        self.checkpointPath = checkpointPath
+        # The replay buffer is not part of a checkpoint
+        if replay in (None, 'none'):
+            self.replayBuffer = None
+        elif replay in ('uniform', 'prioritized'):
+            self.replayBuffer = ReplayBuffer(int(replaySize), replay == 'prioritized')
+        else:
+            raise Exception('Unknown replay %s: use uniform or prioritized' % replay)
+        self.replayBatch = int(replayBatch)
+        if loadCheckpoint:
+            self.loadCheckpoint(loadCheckpoint)
 
     ################################
     # Controls needed for Crawler  #
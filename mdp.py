@@ -13,6 +13,7 @@
 
 
 import random
+from array import array
 
 class MarkovDecisionProcess:
 
@@ -65,3 +66,84 @@ class MarkovDecisionProcess:
         are equivalent.
         """
         abstract
+
+    def getTransitionArrays(self):
+        """
+        Returns the whole model as TransitionArrays, built from the
+        methods above.  Subclasses that can list their transitions
+        more cheaply may override this.
+        """
+        arrays = TransitionArrays(self.getStates())
+        stateIndex = arrays.stateIndex
+        for state in arrays.states:
+            if not self.isTerminal(state):
+                for action in self.getPossibleActions(state):
+                    successors = self.getTransitionStatesAndProbs(state, action)
+                    arrays.addRow(action,
+                                  [stateIndex[nextState] for nextState, prob in successors],
+                                  [prob for nextState, prob in successors],
+                                  [self.getReward(state, action, nextState) for nextState, prob in successors])
+            arrays.endState()
+        return arrays
+
+class TransitionArrays:
+    """
+    The transitions and rewards of a whole MDP in flat arrays, compressed
+    sparse row style, so that solvers can work without a call per
+    transition.
+
+    states[i] is the state numbered i and stateIndex maps it back; the
+    same goes for actions and actionIndex.  The (state, action) pairs
+    of state i are rows actionStart[i] .. actionStart[i+1]-1, in the
+    order getPossibleActions lists them, and rowActions[row] is the
+    index of a row's action.  Its successors are entries
+    entryStart[row] .. entryStart[row+1]-1, each with the index of the
+    next state, the probability and the reward in nextStates, probs and
+    rewards.  Terminal states have no rows.
+    """
+    def __init__(self, states):
+        self.states = list(states)
+        self.stateIndex = dict([(state, i) for i, state in enumerate(self.states)])
+        self.actions = []
+        self.actionIndex = {}
+        self.actionStart = array('l', [0])
+        self.rowActions = array('l')
+        self.entryStart = array('l', [0])
+        self.nextStates = array('l')
+        self.probs = array('d')
+        self.rewards = array('d')
+
+    def addRow(self, action, nextStates, probs, rewards):
+        """
+        Adds the row of action to the state being filled in, given the
+        index, probability and reward of each successor.
+        """
+        if action not in self.actionIndex:
+            self.actionIndex[action] = len(self.actions)
+            self.actions.append(action)
+        self.nextStates.extend(nextStates)
+        self.probs.extend(probs)
+        self.rewards.extend(rewards)
+        self.rowActions.append(self.actionIndex[action])
+        self.entryStart.append(len(self.nextStates))
+
+    def endState(self):
+        "Moves on to the next state, in the order of states"
+        self.actionStart.append(len(self.rowActions))
+
+    def getNumStates(self):
+        return len(self.states)
+
+    def getRows(self, state):
+        "The rows of state, or an empty range for states outside the MDP"
+        i = self.stateIndex.get(state)
+        if i is None: return xrange(0)
+        return xrange(self.actionStart[i], self.actionStart[i+1])
+
+    def getRow(self, state, action):
+        "The row of (state, action), or None if action is not possible there"
+        a = self.actionIndex.get(action)
+        for row in self.getRows(state):
+            if self.rowActions[row] == a:
+                return row
+        return None
@@ -43,6 +43,7 @@ from game import GameStateData
 from game import Game
 from game import Directions
 from game import Actions
+from game import Configuration
 from util import nearestPoint
 from util import manhattanDistance
 import util, layout
@@ -71,11 +72,26 @@ class GameState:
     # Accessor methods: use these to access state data #
     ####################################################
 
-    # static variable keeps track of which states have had getLegalActions called
-    explored = set()
+    # static variable keeps track of the states generateSuccessor has seen:
+    # None (not tracked), a set of them, or a util.DistinctCounter that
+    # only estimates how many there were.  See trackExplored.
+    explored = None
+    def trackExplored(mode):
+        """
+        Turns tracking of explored states 'off', keeps all of them ('set')
+        or only counts them in constant memory ('count').  Keeping them
+        holds every state of a run in memory, so it is off by default.
+        """
+        if mode == 'off': GameState.explored = None
+        elif mode == 'set': GameState.explored = set()
+        elif mode == 'count': GameState.explored = util.DistinctCounter()
+        else: raise Exception('Unknown explored state tracking mode: ' + str(mode))
+    trackExplored = staticmethod(trackExplored)
+
     def getAndResetExplored():
-        tmp = GameState.explored.copy()
-        GameState.explored = set()
+        tmp = GameState.explored
+        if tmp is None: return set()
+        GameState.explored = tmp.__class__()
         return tmp
     getAndResetExplored = staticmethod(getAndResetExplored)
 
@@ -112,7 +128,7 @@ class GameState:
         if agentIndex == 0:
             state.data.scoreChange += -TIME_PENALTY # Penalty for waiting around
         else:
-            GhostRules.decrementTimer( state.data.agentStates[agentIndex] )
+            state.data.agentStates[agentIndex] = GhostRules.decrementTimer( state.data.agentStates[agentIndex] )
 
         # Resolve multi-agent effects
         GhostRules.checkDeath( state, agentIndex )
@@ -120,8 +136,9 @@ class GameState:
         # Book keeping
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
+        if GameState.explored is not None:
+            GameState.explored.add(self)
+            GameState.explored.add(state)
         return state
 
     def getLegalPacmanActions( self ):
@@ -206,6 +223,14 @@ class GameState:
     def hasWall(self, x, y):
         return self.data.layout.walls[x][y]
 
+    def getClosestFoodDistance(self, pos):
+        """
+        Returns the maze distance from pos to the nearest food, or None if
+        no food can be reached.  Successors update the underlying distance
+        field as food is eaten, so repeated calls are cheap.
+        """
+        return self.data.getClosestFoodDistance(pos)
+
     def isLose( self ):
         return self.data._lose
 
@@ -243,6 +268,13 @@ class GameState:
         """
         return hash( self.data )
 
+    def getCompactKey( self ):
+        """
+        Returns a hashable tuple of plain values that is equal for two
+        states exactly when the states are equal (see util.QTable).
+        """
+        return self.data.getCompactKey()
+
     def __str__( self ):
 
         return str(self.data)
@@ -331,7 +363,7 @@ class PacmanRules:
         """
         Returns a list of possible actions.
         """
-        return Actions.getPossibleActions( state.getPacmanState().configuration, state.data.layout.walls )
+        return state.data.layout.getPossibleActions( state.getPacmanState().configuration )
     getLegalActions = staticmethod( getLegalActions )
 
     def applyAction( state, action ):
@@ -346,7 +378,8 @@ class PacmanRules:
 
         # Update Configuration
         vector = Actions.directionToVector( action, PacmanRules.PACMAN_SPEED )
-        pacmanState.configuration = pacmanState.configuration.generateSuccessor( vector )
+        pacmanState = pacmanState.withConfiguration( pacmanState.configuration.generateSuccessor( vector ) )
+        state.data.agentStates[0] = pacmanState
 
         # Eat
         next = pacmanState.configuration.getPosition()
@@ -361,8 +394,7 @@ class PacmanRules:
         # Eat food
         if state.data.food[x][y]:
             state.data.scoreChange += 10
-            state.data.food = state.data.food.copy()
-            state.data.food[x][y] = False
+            state.data.eatFood( position )
             state.data._foodEaten = position
             # TODO: cache numFood?
             numFood = state.getNumFood()
@@ -371,11 +403,12 @@ class PacmanRules:
                 state.data._win = True
         # Eat capsule
         if( position in state.getCapsules() ):
-            state.data.capsules.remove( position )
+            state.data.eatCapsule( position )
             state.data._capsuleEaten = position
             # Reset all ghosts' scared timers
-            for index in range( 1, len( state.data.agentStates ) ):
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
+            agentStates = state.data.agentStates
+            for index in range( 1, len( agentStates ) ):
+                agentStates[index] = agentStates[index].withScaredTimer( SCARED_TIME )
     consume = staticmethod( consume )
 
 class GhostRules:
@@ -389,6 +422,9 @@ class GhostRules:
         reach a dead end, but can turn 90 degrees at intersections.
         """
         conf = state.getGhostState( ghostIndex ).configuration
+        possibleActions = state.data.layout.getGhostActions( conf )
+        if possibleActions is not None:
+            return possibleActions
         possibleActions = Actions.getPossibleActions( conf, state.data.layout.walls )
         reverse = Actions.reverseDirection( conf.direction )
         if Directions.STOP in possibleActions:
@@ -408,14 +444,20 @@ class GhostRules:
         speed = GhostRules.GHOST_SPEED
         if ghostState.scaredTimer > 0: speed /= 2.0
         vector = Actions.directionToVector( action, speed )
-        ghostState.configuration = ghostState.configuration.generateSuccessor( vector )
+        state.data.agentStates[ghostIndex] = ghostState.withConfiguration( ghostState.configuration.generateSuccessor( vector ) )
     applyAction = staticmethod( applyAction )
 
     def decrementTimer( ghostState):
+        """
+        Returns ghostState one move later.
+        """
         timer = ghostState.scaredTimer
+        if timer == 0:
+            return ghostState
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint( ghostState.configuration.pos )
-        ghostState.scaredTimer = max( 0, timer - 1 )
+            configuration = ghostState.configuration
+            ghostState = ghostState.withConfiguration( Configuration( nearestPoint( configuration.pos ), configuration.direction ) )
+        return ghostState.withScaredTimer( timer - 1 )
     decrementTimer = staticmethod( decrementTimer )
 
     def checkDeath( state, agentIndex):
@@ -436,9 +478,10 @@ class GhostRules:
     def collide( state, ghostState, agentIndex):
         if ghostState.scaredTimer > 0:
             state.data.scoreChange += 200
-            GhostRules.placeGhost(state, ghostState)
-            ghostState.scaredTimer = 0
-            # Added for first-person
+            ghostState = GhostRules.placeGhost(state, ghostState)
+            state.data.agentStates[agentIndex] = ghostState.withScaredTimer( 0 )
+            # Added for first-person; the list may be shared with the parent state
+            state.data._eaten = state.data._eaten[:]
             state.data._eaten[agentIndex] = True
         else:
             if not state.data._win:
@@ -451,7 +494,8 @@ class GhostRules:
     canKill = staticmethod( canKill )
 
     def placeGhost(state, ghostState):
-        ghostState.configuration = ghostState.start
+        "Returns ghostState moved back to its start"
+        return ghostState.withConfiguration( ghostState.start )
     placeGhost = staticmethod( placeGhost )
 
 #############################
@@ -510,9 +554,15 @@ def readCommand( argv ):
     parser.add_option('-f', '--fixRandomSeed', action='store_true', dest='fixRandomSeed',
                       help='Fixes the random seed to always play the same game', default=False)
     parser.add_option('-r', '--recordActions', action='store_true', dest='record',
-                      help='Writes game histories to a file (named by the time they were played)', default=False)
+                      help='Writes game histories to a recording (named by the time the run started)', default=False)
+    parser.add_option('--recordFile', dest='recordFile', metavar='FILE',
+                      help='Appends game histories to the recording FILE (implies -r)', default=None)
     parser.add_option('--replay', dest='gameToReplay',
-                      help='A recorded game file (pickle) to replay', default=None)
+                      help='A recorded game file (recording or pickle) to replay', default=None)
+    parser.add_option('--replayGame', dest='replayGame', type='int',
+                      help=default('Which game of a recording to replay'), default=0)
+    parser.add_option('--replayFrom', dest='replayFrom', type='int', metavar='MOVE',
+                      help=default('Move from which to show the replayed game'), default=0)
     parser.add_option('-a','--agentArgs',dest='agentArgs',
                       help='Comma separated values sent to agent. e.g. "opt1=val1,opt2,opt3=val3"')
     parser.add_option('-x', '--numTraining', dest='numTraining', type='int',
@@ -523,6 +573,20 @@ def readCommand( argv ):
                       help='Turns on exception handling and timeouts during games', default=False)
     parser.add_option('--timeout', dest='timeout', type='int',
                       help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('--workers', dest='workers', type='int',
+                      help=default('Number of processes that share the training episodes.  Workers learn from '
+                                   'separate copies that are merged every --syncEvery episodes, so they '
+                                   'usually need more training episodes than one process to reach as good a policy'), default=1)
+    parser.add_option('--syncEvery', dest='syncEvery', type='int',
+                      help='Training episodes each worker plays between merges of what was learned.  Fewer learn '
+                           'closer to serial training but merge more often [Default: %d divided by --workers]' % TRAINING_ROUND_EPISODES,
+                      default=None)
+    parser.add_option('--exploredStates', dest='exploredStates', type='choice', choices=['off', 'set', 'count'],
+                      help=default('Track the distinct states generated: off, set (keeps them all) or count (estimate only)'), default='off')
+    parser.add_option('--profile', action='store_true', dest='profile',
+                      help='Prints the time each agent spent observing, acting, learning and extracting features', default=False)
+    parser.add_option('--profileOutput', dest='profileOutput', metavar='FILE',
+                      help='Runs under cProfile and writes the stats to FILE (for pstats, snakeviz or flameprof)', default=None)
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -532,6 +596,8 @@ def readCommand( argv ):
     # Fix the random seed
     if options.fixRandomSeed: random.seed('cs188')
 
+    GameState.trackExplored( options.exploredStates )
+
     # Choose a layout
     args['layout'] = layout.getLayout( options.layout )
     if args['layout'] == None: raise Exception("The layout " + options.layout + " cannot be found")
@@ -567,18 +633,38 @@ def readCommand( argv ):
         import graphicsDisplay
         args['display'] = graphicsDisplay.PacmanGraphics(options.zoom, frameTime = options.frameTime)
     args['numGames'] = options.numGames
-    args['record'] = options.record
+    args['record'] = options.record or options.recordFile != None
+    if options.recordFile != None:
+        args['recordFile'] = options.recordFile
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
+    args['workers'] = options.workers
+    args['syncEvery'] = options.syncEvery
+    args['profile'] = options.profile
+    if options.profileOutput != None:
+        args['profileOutput'] = options.profileOutput
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay != None:
         print 'Replaying recorded game %s.' % options.gameToReplay
-        import cPickle
-        f = open(options.gameToReplay)
-        try: recorded = cPickle.load(f)
-        finally: f.close()
+        import recording
+        if recording.isRecording(options.gameToReplay):
+            index = recording.RecordingIndex(options.gameToReplay)
+            if not 0 <= options.replayGame < len(index):
+                raise Exception('The recording has %d games' % len(index))
+            game = index.games[options.replayGame]
+            recorded = {'layout': index.getLayout(game), 'actions': index.getActions(game),
+                        'numGhosts': game.numAgents - 1}
+        else:
+            import cPickle
+            f = open(options.gameToReplay)
+            try: recorded = cPickle.load(f)
+            finally: f.close()
+            # Pickles written before layouts were shared hold layouts without
+            # the tables Layout builds lazily; use the shared one instead
+            recorded['layout'] = layout.internLayout(recorded['layout'].layoutText)
         recorded['display'] = args['display']
+        recorded['startMove'] = options.replayFrom
         replayGame(**recorded)
         sys.exit(0)
 
@@ -607,15 +693,20 @@ def loadAgent(pacman, nographics):
                 return getattr(module, pacman)
     raise Exception('The agent ' + pacman + ' is not specified in any *Agents.py.')
 
-def replayGame( layout, actions, display ):
-    import pacmanAgents, ghostAgents
+def replayGame( layout, actions, display, numGhosts=None, startMove=0 ):
+    """
+    Shows a recorded game (see recording.py) from its startMove-th move on;
+    the moves before it are played without the display.
+    """
+    import pacmanAgents, ghostAgents, recording
+    if numGhosts == None: numGhosts = layout.getNumGhosts()
     rules = ClassicGameRules()
-    agents = [pacmanAgents.GreedyAgent()] + [ghostAgents.RandomGhost(i+1) for i in range(layout.getNumGhosts())]
+    agents = [pacmanAgents.GreedyAgent()] + [ghostAgents.RandomGhost(i+1) for i in range(numGhosts)]
     game = rules.newGame( layout, agents[0], agents[1:], display )
-    state = game.state
+    state = recording.GameReplay( layout, actions, numGhosts ).getState( startMove )
     display.initialize(state.data)
 
-    for action in actions:
+    for action in actions[startMove:]:
             # Execute the action
         state = state.generateSuccessor( *action )
         # Change the display
@@ -625,14 +716,158 @@ def replayGame( layout, actions, display ):
 
     display.finish()
 
-def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30 ):
+# Training episodes all workers play together between merges, unless
+# --syncEvery says otherwise.  Q-learning on smallGrid with 4 workers of
+# 5 episodes per round wins about as often after 2000 episodes as serial
+# training does, but after 400 episodes still wins about a third less.
+TRAINING_ROUND_EPISODES = 20
+
+# Set up in each training worker process by _initTrainingWorker
+_TRAINING_CONTEXT = {}
+
+def _initTrainingWorker( layout, pacman, ghosts, catchExceptions, timeout ):
+    """
+    Runs once in every worker process of runParallelTraining.  The
+    worker keeps its own copy of the learner for the whole run.
+    """
+    pacman.checkpointEvery = 0    # the parent process saves checkpoints
+    _TRAINING_CONTEXT.update({'layout': layout, 'pacman': pacman, 'ghosts': ghosts,
+                              'catchExceptions': catchExceptions, 'timeout': timeout,
+                              'rules': ClassicGameRules(timeout), 'trainingRound': 0})
+
+def _runTrainingShard( task ):
+    """
+    Plays one shard of training episodes inside a worker process.  The
+    worker's learner first undoes its own unmerged changes from its last
+    shard and takes the merged entries it has not seen yet.  Returns the
+    entries the shard changed, the training rewards it collected, the
+    worker's process id and the round its learner is now up to.
+    """
+    trainingRound, firstEpisode, numEpisodes, seed, epsilon, alpha, updates = task
+    context = _TRAINING_CONTEXT
+    pacman = context['pacman']
+    random.seed(seed)
+    util.mutePrint()
+    try:
+        if context['trainingRound'] > 0:
+            pacman.revertChangedParameters()
+        pacman.updateLearnedParameters(updates)
+        pacman.trackLearnedParameters()
+        context['trainingRound'] = trainingRound
+        pacman.episodesSoFar = firstEpisode
+        pacman.accumTrainRewards = 0.0
+        pacman.epsilon = epsilon
+        pacman.alpha = alpha
+        import textDisplay
+        for i in range( numEpisodes ):
+            game = context['rules'].newGame( context['layout'], pacman, context['ghosts'], textDisplay.NullGraphics(), True, context['catchExceptions'] )
+            if context['catchExceptions']: game.run()
+            else: game.runFast()
+        return pacman.getChangedParameters(), pacman.accumTrainRewards, os.getpid(), trainingRound
+    finally:
+        util.unmutePrint()
+
+def runParallelTraining( layout, pacman, ghosts, numTraining, workers, syncEvery, catchExceptions=False, timeout=30 ):
+    """
+    Plays the first numTraining episodes on a pool of worker processes,
+    started once with a copy of pacman each.  Every round each worker
+    trains its copy for syncEvery episodes (TRAINING_ROUND_EPISODES
+    shared among the workers if None), then the entries the copies
+    changed are merged into pacman with pacman.mergeLearnedParameters
+    before the next round starts.  Only changed entries travel between
+    the processes, in both directions.  The copies do not see each
+    other's updates during a round, so larger rounds learn less per
+    episode than serial training.  Episodes pacman already trained on
+    (see ReinforcementAgent.loadCheckpoint) are skipped, and its
+    checkpoint is saved after the rounds in which it is due.
+    """
+    if not hasattr(pacman, 'getLearnedParameters'):
+        raise Exception('--workers needs a learning agent (see learningAgents.ReinforcementAgent)')
+    import multiprocessing
+    if syncEvery is None:
+        syncEvery = max(1, TRAINING_ROUND_EPISODES // workers)
+    print 'Beginning %d episodes of Training on %d workers' % (numTraining, workers)
+    pool = multiprocessing.Pool(workers, _initTrainingWorker, (layout, pacman, ghosts, catchExceptions, timeout))
+    try:
+        # merges[r] holds the entries merged after round r + 1, and
+        # workerRounds the round each worker process last played.  A
+        # worker is sent every merge since the oldest round any worker
+        # may be behind at; the values are absolute, so repeats are harmless.
+        merges = []
+        firstMerge = 0
+        workerRounds = {}
+        trainingRound = 0
+        episode = min(pacman.episodesSoFar, numTraining)
+        while episode < numTraining:
+            trainingRound += 1
+            if len(workerRounds) < workers:
+                oldest = 1
+            else:
+                oldest = max(1, min(workerRounds.values()))
+            updates = {}
+            for merged in merges[oldest - 1 - firstMerge:]:
+                updates.update(merged)
+            tasks = []
+            for w in range( workers ):
+                numEpisodes = min(syncEvery, numTraining - episode)
+                if numEpisodes <= 0: break
+                seed = random.randint(0, sys.maxint)
+                tasks.append( (trainingRound, episode, numEpisodes, seed, pacman.epsilon, pacman.alpha, updates) )
+                episode += numEpisodes
+            results = pool.map(_runTrainingShard, tasks, 1)
+            for changed, rewards, pid, workerRound in results:
+                workerRounds[pid] = max(workerRounds.get(pid, 0), workerRound)
+            merged = pacman.mergeLearnedParameters(pacman.getLearnedParameters(), [changed for changed, rewards, pid, workerRound in results])
+            pacman.updateLearnedParameters(merged)
+            merges.append(merged)
+            # Forget merges every worker has already taken
+            if len(workerRounds) == workers:
+                drop = min(workerRounds.values()) - 1 - firstMerge
+                if drop > 0:
+                    del merges[:drop]
+                    firstMerge += drop
+            pacman.accumTrainRewards += sum([rewards for changed, rewards, pid, workerRound in results])
+            previousEpisodes = pacman.episodesSoFar
+            pacman.episodesSoFar = episode
+            print '\tCompleted %d out of %d training episodes' % (episode, numTraining)
+            if episode == numTraining:
+                # Take off the training wheels, as ReinforcementAgent.stopEpisode would
+                pacman.epsilon = 0.0
+                pacman.alpha = 0.0
+            every = pacman.checkpointEvery
+            if every > 0 and (episode // every > previousEpisodes // every or episode == numTraining):
+                pacman.saveCheckpoint()
+    finally:
+        pool.close()
+        pool.join()
+
+    print '\tAverage Rewards over all training: %.2f' % (pacman.accumTrainRewards / float(numTraining))
+    msg = 'Training Done (turning off epsilon and alpha)'
+    print '%s\n%s' % (msg,'-' * len(msg))
+
+def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30, workers=1, syncEvery=None, profile=False, recordFile=None ):
     import __main__
     __main__.__dict__['_display'] = display
 
     rules = ClassicGameRules(timeout)
     games = []
+    if profile:
+        timings = util.Timings()
+    if record:
+        import recording
+        if recordFile is None:
+            recordFile = 'recorded-games-' + '-'.join([str(t) for t in time.localtime()[:6]]) + '.rec'
+        recorder = recording.RecordingWriter(recordFile)
+
+    # A learner resumed from a checkpoint skips the episodes it has done
+    firstGame = min(getattr(pacman, 'episodesSoFar', 0), numTraining)
+    if workers > 1 and firstGame < numTraining:
+        if record:
+            print >>sys.stderr, 'Warning: training episodes played by --workers are not recorded'
+        runParallelTraining( layout, pacman, ghosts, numTraining, workers, syncEvery, catchExceptions, timeout )
+        firstGame = numTraining
 
-    for i in range( numGames ):
+    for i in range( firstGame, numGames ):
         beQuiet = i < numTraining
         if beQuiet:
                 # Suppress output and graphics
@@ -643,16 +878,24 @@ def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0
             gameDisplay = display
             rules.quiet = False
         game = rules.newGame( layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions)
-        game.run()
+        if profile:
+            game.timings = util.Timings()
+        if record:
+            recorder.startGame(layout, len(game.agents))
+            game.recorder = recorder
+        if beQuiet and not catchExceptions:
+            game.runFast()
+        else:
+            game.run()
         if not beQuiet: games.append(game)
+        if profile:
+            timings.merge(game.timings)
 
         if record:
-            import time, cPickle
-            fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
-            f = file(fname, 'w')
-            components = {'layout': layout, 'actions': game.moveHistory}
-            cPickle.dump(components, f)
-            f.close()
+            recorder.endGame(game.state)
+
+    if record:
+        recorder.close()
 
     if (numGames-numTraining) > 0:
         scores = [game.state.getScore() for game in games]
@@ -663,6 +906,14 @@ def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0
         print 'Win Rate:      %d/%d (%.2f)' % (wins.count(True), len(wins), winRate)
         print 'Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in wins])
 
+    if GameState.explored is not None:
+        print 'Distinct states generated:', len(GameState.explored)
+
+    if profile:
+        # Training episodes played by --workers processes are not included
+        print 'Time spent per agent (all games played here):'
+        print timings.summary()
+
     return games
 
 if __name__ == '__main__':
@@ -677,8 +928,12 @@ if __name__ == '__main__':
     > python pacman.py --help
     """
     args = readCommand( sys.argv[1:] ) # Get game components based on input
-    runGames( **args )
-
-    # import cProfile
-    # cProfile.run("runGames( **args )")
-    pass
+    profileOutput = args.pop('profileOutput', None)
+    if profileOutput == None:
+        runGames( **args )
+    else:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.runcall( runGames, **args )
+        profiler.dump_stats( profileOutput )
+        print 'Profile written to', profileOutput
@@ -16,7 +16,7 @@ from game import *
 from learningAgents import ReinforcementAgent
 from featureExtractors import *
 
-import random,util,math
+import random,util,math,collections,time
 
 class QLearningAgent(ReinforcementAgent):
     """
@@ -40,10 +40,10 @@ class QLearningAgent(ReinforcementAgent):
     """
     def __init__(self, **args):
         "You can initialize Q-values here..."
-        ReinforcementAgent.__init__(self, **args)
-
         "*** YOUR CODE HERE ***"
-        self.qValues = {} # (state, action) -> qValue
+        self.qValues = util.QTable() # (state, action) -> qValue
+
+        ReinforcementAgent.__init__(self, **args)
 
     def getQValue(self, state, action):
         """
@@ -54,6 +54,14 @@ class QLearningAgent(ReinforcementAgent):
         "*** YOUR CODE HERE ***"
         return self.qValues.get((state, action), 0.0)
 
+    def getQValues(self, state, actions):
+        """
+          Returns [Q(state,action) for action in actions], read from
+          a single row of the table.  Subclasses that redefine
+          getQValue must redefine this too.
+        """
+        return self.qValues.getValues(state, actions)
+
     def computeValueFromQValues(self, state):
         """
           Returns max_action Q(state,action)
@@ -65,8 +73,7 @@ class QLearningAgent(ReinforcementAgent):
         legalActions = self.getLegalActions(state)
         if len(legalActions) == 0:
             return 0.0
-        qValues = [self.getQValue(state, action) for action in legalActions]
-        return max(qValues)
+        return max(self.getQValues(state, legalActions))
 
     def computeActionFromQValues(self, state):
         """
@@ -78,7 +85,7 @@ class QLearningAgent(ReinforcementAgent):
         legalActions = self.getLegalActions(state)
         if len(legalActions) == 0:
             return None
-        legalActions = map(lambda action: (action, self.getQValue(state, action)), legalActions)
+        legalActions = zip(legalActions, self.getQValues(state, legalActions))
         legalActions.sort(key=lambda action: action[1], reverse=True)
         currBestQValue = legalActions[0][1]
         bestActions = [action for action, qValue in legalActions if qValue == currBestQValue]
@@ -121,6 +128,42 @@ class QLearningAgent(ReinforcementAgent):
         "*** YOUR CODE HERE ***"
         self.qValues[(state, action)] = (1 - self.alpha) * self.getQValue(state, action) + self.alpha * (reward + self.discount * self.computeValueFromQValues(nextState))
 
+    def encodeTransition(self, state, action, nextState, reward):
+        # The table keys of the states stand in for them, along with the
+        # next state's legal actions
+        nextActions = tuple(self.getLegalActions(nextState))
+        return (self.qValues.getStateKey(state), action,
+                self.qValues.getStateKey(nextState), reward, nextActions)
+
+    def replayTransition(self, transition, weight=1.0):
+        stateKey, action, nextStateKey, reward, nextActions = transition
+        nextValue = 0.0
+        if nextActions:
+            nextValue = max(self.qValues.getValues(nextStateKey, nextActions))
+        qValue = self.qValues.get((stateKey, action), 0.0)
+        difference = reward + self.discount * nextValue - qValue
+        self.qValues[(stateKey, action)] = qValue + weight * self.alpha * difference
+        return difference
+
+    def getLearnedParameters(self):
+        return self.qValues
+
+    def setLearnedParameters(self, parameters):
+        self.qValues = util.QTable()
+        self.qValues.update(parameters)
+
+    def updateLearnedParameters(self, changes):
+        self.qValues.update(changes)
+
+    def trackLearnedParameters(self):
+        self.qValues.trackChanges()
+
+    def getChangedParameters(self):
+        return self.qValues.getChanges()
+
+    def revertChangedParameters(self):
+        self.qValues.revertChanges()
+
     def getPolicy(self, state):
         return self.computeActionFromQValues(state)
 
@@ -171,35 +214,239 @@ class ApproximateQAgent(PacmanQAgent):
        and update.  All other QLearningAgent functions
        should work as is.
     """
-    def __init__(self, extractor='IdentityExtractor', **args):
+    def __init__(self, extractor='IdentityExtractor', featureCacheSize=500,
+                 updateEvery=1, targetUpdateEvery=0, **args):
+        """
+        updateEvery       - transitions whose weight updates are gathered and
+                            applied together (0 waits for the end of the episode)
+        targetUpdateEvery - if not 0, the values of next states come from a copy
+                            of the weights refreshed after this many transitions
+        """
         self.featExtractor = util.lookup(extractor, globals())()
-        PacmanQAgent.__init__(self, **args)
+        # (state, action) -> features, least recently used first.  Each
+        # state's features are needed by getAction and again by the next
+        # two updates, so a short memory avoids most recomputation.
+        self.featureCache = collections.OrderedDict()
+        self.featureCacheSize = int(featureCacheSize)
+        self.featureCacheHits = 0
+        self.featureCacheMisses = 0
         self.weights = util.Counter()
+        # Extractors with a fixed list of features get a dense weight
+        # list instead, aligned with their feature vectors
+        self.featureNames = self.featExtractor.featureNames
+        if self.featureNames is not None:
+            self.weightVector = [0.0] * len(self.featureNames)
+        self.updateEvery = int(updateEvery)
+        self.targetUpdateEvery = int(targetUpdateEvery)
+        self.pendingUpdates = []
+        self.targetWeights = None
+        self.updatesSinceTarget = 0
+        PacmanQAgent.__init__(self, **args)
 
     def getWeights(self):
+        if self.featureNames is not None:
+            return util.Counter(zip(self.featureNames, self.weightVector))
         return self.weights
 
+    def getCachedFeatureMatrix(self, state, actions):
+        """
+          Returns the features of (state, action) for every action, as
+          vectors when the extractor has featureNames and as Counters
+          otherwise.  Only features missing from the cache are extracted.
+        """
+        cache = self.featureCache
+        missing = [action for action in actions if (state, action) not in cache]
+        self.featureCacheMisses += len(missing)
+        self.featureCacheHits += len(actions) - len(missing)
+        if missing:
+            if self.timings is not None:
+                start = time.time()
+            if self.featureNames is not None:
+                extracted = self.featExtractor.getFeatureMatrix(state, missing)
+            else:
+                extracted = self.featExtractor.getFeaturesForActions(state, missing)
+            if self.timings is not None:
+                self.timings.add((self.index, 'features'), time.time() - start, len(missing))
+            cache.update(zip([(state, action) for action in missing], extracted))
+        matrix = []
+        for action in actions:
+            # move the entry to the most recently used end
+            features = cache.pop((state, action))
+            cache[(state, action)] = features
+            matrix.append(features)
+        while len(cache) > self.featureCacheSize:
+            cache.popitem(last=False)
+        return matrix
+
+    def getCachedFeatures(self, state, action):
+        return self.getCachedFeatureMatrix(state, [action])[0]
+
+    def getFeatureCacheStats(self):
+        "Returns (hits, misses) of feature lookups since the agent was created"
+        return self.featureCacheHits, self.featureCacheMisses
+
+    def startEpisode(self):
+        PacmanQAgent.startEpisode(self)
+        self.featureCache.clear()
+
+    def stopEpisode(self):
+        # before training may end and alpha drop to 0
+        self.applyPendingUpdates()
+        PacmanQAgent.stopEpisode(self)
+
     def getQValue(self, state, action):
         """
           Should return Q(state,action) = w * featureVector
           where * is the dotProduct operator
         """
         "*** YOUR CODE HERE ***"
-        features = self.featExtractor.getFeatures(state, action)
+        if self.featureNames is not None:
+            return util.dotProduct(self.weightVector, self.getCachedFeatures(state, action))
+        features = self.getCachedFeatures(state, action)
         weighted_values = [self.weights[feature] * features[feature] for feature in features]
         # print(features)
         return sum(weighted_values)
 
+    def getQValues(self, state, actions):
+        """
+          Scores all actions with one (actions x features) matrix
+          when the extractor supports feature vectors
+        """
+        if self.featureNames is None:
+            return [self.getQValue(state, action) for action in actions]
+        weights = self.weightVector
+        return [util.dotProduct(weights, features)
+                for features in self.getCachedFeatureMatrix(state, actions)]
+
     def update(self, state, action, nextState, reward):
         """
            Should update your weights based on transition
         """
         "*** YOUR CODE HERE ***"
+        if self.updateEvery != 1 or self.targetUpdateEvery:
+            self.pendingUpdates.append(self.encodeTransition(state, action, nextState, reward))
+            if len(self.pendingUpdates) == self.updateEvery:
+                self.applyPendingUpdates()
+            return
+        if self.featureNames is not None:
+            features = self.getCachedFeatures(state, action)
+            difference = reward + self.discount * self.computeValueFromQValues(nextState) - util.dotProduct(self.weightVector, features)
+            step = self.alpha * difference
+            self.weightVector = [weight + step * value for weight, value in zip(self.weightVector, features)]
+            return
         difference = reward + self.discount * self.computeValueFromQValues(nextState) - self.getQValue(state, action)
-        features = self.featExtractor.getFeatures(state, action)
+        features = self.getCachedFeatures(state, action)
         for feature in features:
             self.weights[feature] = self.weights[feature] + self.alpha * difference * features[feature]
 
+    def encodeTransition(self, state, action, nextState, reward):
+        # Only the features are kept: those of the action taken and those
+        # of every action legal in the next state
+        nextActions = self.getLegalActions(nextState)
+        nextFeatures = []
+        if nextActions:
+            nextFeatures = self.getCachedFeatureMatrix(nextState, nextActions)
+        return (self.getCachedFeatures(state, action), nextFeatures, reward)
+
+    def getTargetWeights(self):
+        """
+          The weights next states are valued with: the current ones, or
+          a frozen copy when targetUpdateEvery is set
+        """
+        if not self.targetUpdateEvery:
+            return self.getWeightsInUse()
+        if self.targetWeights is None:
+            self.targetWeights = self.getWeightsInUse()
+            if self.featureNames is not None:
+                self.targetWeights = list(self.targetWeights)
+            else:
+                self.targetWeights = self.targetWeights.copy()
+        return self.targetWeights
+
+    def getWeightsInUse(self):
+        if self.featureNames is not None:
+            return self.weightVector
+        return self.weights
+
+    def getDifference(self, transition):
+        """
+          The TD error of a transition kept by encodeTransition
+        """
+        features, nextFeatures, reward = transition
+        weights, target = self.getWeightsInUse(), self.getTargetWeights()
+        if self.featureNames is not None:
+            qValues = [util.dotProduct(target, f) for f in nextFeatures]
+            return reward + self.discount * max(qValues or [0.0]) - util.dotProduct(weights, features)
+        qValues = [sum([target[f] * value for f, value in fs.items()]) for fs in nextFeatures]
+        qValue = sum([weights[f] * value for f, value in features.items()])
+        return reward + self.discount * max(qValues or [0.0]) - qValue
+
+    def replayTransition(self, transition, weight=1.0):
+        features = transition[0]
+        difference = self.getDifference(transition)
+        step = weight * self.alpha * difference
+        if self.featureNames is not None:
+            self.weightVector = [w + step * value for w, value in zip(self.weightVector, features)]
+        else:
+            for feature in features:
+                self.weights[feature] = self.weights[feature] + step * features[feature]
+        return difference
+
+    def applyPendingUpdates(self):
+        """
+          Applies the updates gathered since the last call as one step:
+          every TD error is measured against the same weights and the
+          steps are added up feature by feature
+        """
+        batch = self.pendingUpdates
+        if not batch:
+            return
+        self.pendingUpdates = []
+        steps = [self.alpha * self.getDifference(transition) for transition in batch]
+        if self.featureNames is not None:
+            # (features x batch) times (batch) -> one step per feature
+            columns = zip(*[features for features, nextFeatures, reward in batch])
+            self.weightVector = [w + util.dotProduct(steps, column)
+                                 for w, column in zip(self.weightVector, columns)]
+        else:
+            change = util.Counter()
+            for step, (features, nextFeatures, reward) in zip(steps, batch):
+                for feature, value in features.items():
+                    change[feature] += step * value
+            for feature, value in change.items():
+                self.weights[feature] = self.weights[feature] + value
+        if self.targetUpdateEvery:
+            self.updatesSinceTarget += len(batch)
+            if self.updatesSinceTarget >= self.targetUpdateEvery:
+                self.targetWeights = None
+                self.updatesSinceTarget = 0
+
+    def getLearnedParameters(self):
+        if self.featureNames is not None:
+            return dict(zip(self.featureNames, self.weightVector))
+        return self.weights
+
+    def setLearnedParameters(self, parameters):
+        if self.featureNames is not None:
+            self.weightVector = [parameters.get(name, 0.0) for name in self.featureNames]
+        else:
+            self.weights = util.Counter(parameters)
+        self.targetWeights = None
+
+    # The weights are few, so the generic versions that compare
+    # snapshots serve better than QLearningAgent's, which track qValues
+    def updateLearnedParameters(self, changes):
+        ReinforcementAgent.updateLearnedParameters(self, changes)
+
+    def trackLearnedParameters(self):
+        ReinforcementAgent.trackLearnedParameters(self)
+
+    def getChangedParameters(self):
+        return ReinforcementAgent.getChangedParameters(self)
+
+    def revertChangedParameters(self):
+        ReinforcementAgent.revertChangedParameters(self)
+
 
     def final(self, state):
         "Called at the end of each game."
@@ -210,4 +457,7 @@ class ApproximateQAgent(PacmanQAgent):
         if self.episodesSoFar == self.numTraining:
             # you might want to print your weights here for debugging
             "*** YOUR CODE HERE ***"
-            pass
+            hits, misses = self.getFeatureCacheStats()
+            if hits + misses:
+                print 'Feature cache: %d hits, %d misses (%.1f%% hit rate)' % (
+                       hits, misses, 100.0 * hits / (hits + misses))
@@ -0,0 +1,409 @@
+# recording.py
+# ------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+A compact, append-only file format for recorded games.
+
+A recording starts with MAGIC and continues with records, each led by
+a one byte tag:
+
+  'L'  a layout: the sha1 of its text, the length of the text, the text.
+       Written once per file, before the first game on that layout.
+  'G'  a game starts: layout sha1, game number, number of agents.
+       Games replay from their moves alone, so no random seed is kept.
+  'M'  a chunk of moves of the current game: a count, then two bytes
+       per move, the agent index and the action (see ACTION_CODES).
+  'E'  the current game ends: final score, outcome (see OUTCOMES) and
+       number of moves.
+
+Numbers are little endian.  Version 1 recordings, whose 'G' records
+also held a seed (always 0 after the first release), can still be
+read.  A writer appends moves as the game is
+played, so an interrupted run leaves every finished game readable.
+
+RecordingIndex finds the games of a recording without decoding their
+moves, and GameReplay plays one back headlessly: to any move, or into
+the (state, action, nextState, reward) transitions a learner saw.
+"""
+
+from game import Directions
+import layout
+import os, struct, hashlib
+
+MAGIC = 'PACREC\x00\x02'
+MAGIC_V1 = 'PACREC\x00\x01'
+
+ACTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+ACTION_CODES = dict([(action, code) for code, action in enumerate(ACTIONS)])
+NO_ACTION = 255
+
+LOSS, WIN, UNFINISHED = 0, 1, 2
+OUTCOMES = ['Loss', 'Win', 'Unfinished']
+
+LAYOUT_RECORD = struct.Struct('<c20sI')
+GAME_RECORD = struct.Struct('<c20sIB')
+GAME_RECORD_V1 = struct.Struct('<c20sIIB')
+MOVES_RECORD = struct.Struct('<cH')
+END_RECORD = struct.Struct('<cdBI')
+
+# Moves a writer holds before appending them to the file
+CHUNK_MOVES = 512
+
+def readMagic(f, path):
+    "Reads the start of a recording and returns its version"
+    magic = f.read(len(MAGIC))
+    if magic == MAGIC: return 2
+    if magic == MAGIC_V1: return 1
+    raise Exception('%s is not a game recording' % path)
+
+def readGameRecord(f, tag, version):
+    "Reads the rest of a 'G' record: ('G', digest, gameNumber, numAgents)"
+    if version == 1:
+        tag, digest, number, seed, numAgents = GAME_RECORD_V1.unpack(tag + f.read(GAME_RECORD_V1.size - 1))
+        return (tag, digest, number, numAgents)
+    return GAME_RECORD.unpack(tag + f.read(GAME_RECORD.size - 1))
+
+def getLayoutDigest(lay):
+    return hashlib.sha1('\n'.join(lay.layoutText)).digest()
+
+def encodeMoves(moves):
+    "Packs a list of (agentIndex, action) pairs into two bytes each"
+    data = bytearray()
+    for agentIndex, action in moves:
+        data.append(agentIndex)
+        data.append(ACTION_CODES.get(action, NO_ACTION))
+    return str(data)
+
+def decodeMoves(data):
+    data = bytearray(data)
+    return [(data[i], data[i + 1] != NO_ACTION and ACTIONS[data[i + 1]] or None)
+            for i in range(0, len(data), 2)]
+
+class RecordingWriter:
+    """
+    Appends games to a recording file, as they are played:
+
+      writer.startGame(layout, numAgents)
+      writer.recordMove(agentIndex, action)    # once per move
+      writer.endGame(state)
+
+    Opening an existing recording appends to it; version 1 recordings
+    are read-only.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.layoutDigests = set()
+        self.numGames = 0
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            f = open(path, 'rb')
+            try: version = readMagic(f, path)
+            finally: f.close()
+            if version != 2:
+                raise Exception('%s is an older recording; record to a new file' % path)
+            for record in readRecords(path):
+                if record[0] == 'L':
+                    self.layoutDigests.add(record[1])
+                elif record[0] == 'G':
+                    self.numGames = max(self.numGames, record[2] + 1)
+            self.file = open(path, 'ab')
+        else:
+            self.file = open(path, 'wb')
+            self.file.write(MAGIC)
+        self.moves = []
+        self.numMoves = 0
+        self.inGame = False
+
+    def startGame(self, lay, numAgents):
+        """
+        Starts recording a game; returns its number in the file.
+        """
+        if self.inGame:
+            raise Exception('The previous game was not ended')
+        digest = getLayoutDigest(lay)
+        if digest not in self.layoutDigests:
+            text = '\n'.join(lay.layoutText)
+            self.file.write(LAYOUT_RECORD.pack('L', digest, len(text)))
+            self.file.write(text)
+            self.layoutDigests.add(digest)
+        gameNumber = self.numGames
+        self.file.write(GAME_RECORD.pack('G', digest, gameNumber, numAgents))
+        self.numGames += 1
+        self.moves = []
+        self.numMoves = 0
+        self.inGame = True
+        return gameNumber
+
+    def recordMove(self, agentIndex, action):
+        self.moves.append((agentIndex, action))
+        if len(self.moves) >= CHUNK_MOVES:
+            self.flushMoves()
+
+    def flushMoves(self):
+        if self.moves:
+            self.file.write(MOVES_RECORD.pack('M', len(self.moves)))
+            self.file.write(encodeMoves(self.moves))
+            self.numMoves += len(self.moves)
+            self.moves = []
+
+    def endGame(self, state):
+        """
+        Ends the current game, which finished in state.
+        """
+        self.flushMoves()
+        if state.isWin():
+            outcome = WIN
+        elif state.isLose():
+            outcome = LOSS
+        else:
+            outcome = UNFINISHED
+        self.file.write(END_RECORD.pack('E', state.getScore(), outcome, self.numMoves))
+        self.file.flush()
+        self.inGame = False
+
+    def close(self):
+        if self.inGame:
+            self.flushMoves()
+        self.file.close()
+
+def readRecords(path):
+    """
+    Yields the records of a recording as tuples:
+
+      ('L', digest, layoutText)
+      ('G', digest, gameNumber, numAgents)
+      ('M', [(agentIndex, action), ...])
+      ('E', score, outcome, numMoves)
+    """
+    f = open(path, 'rb')
+    try:
+        version = readMagic(f, path)
+        while True:
+            tag = f.read(1)
+            if not tag:
+                return
+            if tag == 'L':
+                tag, digest, length = LAYOUT_RECORD.unpack(tag + f.read(LAYOUT_RECORD.size - 1))
+                yield ('L', digest, f.read(length))
+            elif tag == 'G':
+                yield readGameRecord(f, tag, version)
+            elif tag == 'M':
+                tag, count = MOVES_RECORD.unpack(tag + f.read(MOVES_RECORD.size - 1))
+                yield ('M', decodeMoves(f.read(2 * count)))
+            elif tag == 'E':
+                yield END_RECORD.unpack(tag + f.read(END_RECORD.size - 1))
+            else:
+                raise Exception('Unknown record %r in %s' % (tag, path))
+    finally:
+        f.close()
+
+def isRecording(path):
+    f = open(path, 'rb')
+    try: return f.read(len(MAGIC)) in (MAGIC, MAGIC_V1)
+    finally: f.close()
+
+def readGames(path):
+    """
+    Yields every game in a recording as a dict with the keys layout,
+    number, numAgents, actions (a list like Game.moveHistory),
+    score and outcome.  Games the recording ends in the middle of have
+    score None and outcome UNFINISHED.
+    """
+    layouts = {}
+    game = None
+    for record in readRecords(path):
+        tag = record[0]
+        if tag == 'L':
+            layouts[record[1]] = layout.internLayout(record[2].split('\n'))
+        elif tag == 'G':
+            if game is not None:
+                yield game
+            game = {'layout': layouts[record[1]], 'number': record[2], 'numAgents': record[3],
+                    'actions': [], 'score': None, 'outcome': UNFINISHED}
+        elif tag == 'M':
+            game['actions'].extend(record[1])
+        elif tag == 'E':
+            game['score'], game['outcome'] = record[1], record[2]
+            yield game
+            game = None
+    if game is not None:
+        yield game
+
+class RecordedGame:
+    """
+    Where one game of a recording is stored; see RecordingIndex.
+    """
+    def __init__(self, number, numAgents, layoutDigest):
+        self.number = number
+        self.numAgents = numAgents
+        self.layoutDigest = layoutDigest
+        self.chunks = [] # (file offset, number of moves) of each 'M' record
+        self.numMoves = 0
+        self.score = None
+        self.outcome = UNFINISHED
+
+class RecordingIndex:
+    """
+    The games of a recording, found with one pass over the file that
+    skips the moves, so that any game can then be read on its own:
+
+      index = RecordingIndex(path)
+      replay = index.getReplay(index.games[17])
+      state = replay.getState(250)  # the board after 250 moves
+    """
+    def __init__(self, path):
+        self.path = path
+        self.games = []
+        self.layoutOffsets = {} # digest -> (file offset, length) of the text
+        self.layouts = {}
+        f = open(path, 'rb')
+        try:
+            version = readMagic(f, path)
+            game = None
+            while True:
+                tag = f.read(1)
+                if not tag:
+                    break
+                if tag == 'L':
+                    tag, digest, length = LAYOUT_RECORD.unpack(tag + f.read(LAYOUT_RECORD.size - 1))
+                    self.layoutOffsets[digest] = (f.tell(), length)
+                    f.seek(length, 1)
+                elif tag == 'G':
+                    tag, digest, number, numAgents = readGameRecord(f, tag, version)
+                    game = RecordedGame(number, numAgents, digest)
+                    self.games.append(game)
+                elif tag == 'M':
+                    tag, count = MOVES_RECORD.unpack(tag + f.read(MOVES_RECORD.size - 1))
+                    game.chunks.append((f.tell(), count))
+                    game.numMoves += count
+                    f.seek(2 * count, 1)
+                elif tag == 'E':
+                    tag, game.score, game.outcome, numMoves = END_RECORD.unpack(tag + f.read(END_RECORD.size - 1))
+                    game = None
+                else:
+                    raise Exception('Unknown record %r in %s' % (tag, path))
+        finally:
+            f.close()
+
+    def __len__(self):
+        return len(self.games)
+
+    def getLayout(self, game):
+        digest = game.layoutDigest
+        if digest not in self.layouts:
+            offset, length = self.layoutOffsets[digest]
+            f = open(self.path, 'rb')
+            try:
+                f.seek(offset)
+                self.layouts[digest] = layout.internLayout(f.read(length).split('\n'))
+            finally:
+                f.close()
+        return self.layouts[digest]
+
+    def getActions(self, game):
+        "Returns the moves of game, as in Game.moveHistory"
+        actions = []
+        f = open(self.path, 'rb')
+        try:
+            for offset, count in game.chunks:
+                f.seek(offset)
+                actions.extend(decodeMoves(f.read(2 * count)))
+        finally:
+            f.close()
+        return actions
+
+    def getReplay(self, game):
+        return GameReplay(self.getLayout(game), self.getActions(game), game.numAgents - 1)
+
+    def getTransitions(self, agentIndex=0, games=None):
+        """
+        Yields the (state, action, nextState, reward) transitions of
+        agentIndex in every game, or in the given games; see
+        GameReplay.getTransitions.
+        """
+        if games is None:
+            games = self.games
+        for game in games:
+            for transition in self.getReplay(game).getTransitions(agentIndex):
+                yield transition
+
+class GameReplay:
+    """
+    Plays a list of moves (as in Game.moveHistory) from the start of a
+    game, without agents or display.  States are generated on demand and
+    every checkpointEvery-th one is kept, so that seeking back and forth
+    only replays the moves since the nearest kept state.
+    """
+    def __init__(self, lay, actions, numGhosts=None, checkpointEvery=64):
+        import pacman
+        self.layout = lay
+        self.actions = actions
+        self.checkpointEvery = checkpointEvery
+        start = pacman.GameState()
+        if numGhosts is None:
+            start.initialize(lay)
+        else:
+            start.initialize(lay, numGhosts)
+        self.checkpoints = {0: start}
+
+    def __len__(self):
+        return len(self.actions)
+
+    def getState(self, move):
+        """
+        Returns the state after the first move moves have been made.
+        """
+        if move < 0 or move > len(self.actions):
+            raise Exception('Move %d is not in a game of %d moves' % (move, len(self.actions)))
+        every = self.checkpointEvery
+        first = move - move % every
+        while first not in self.checkpoints:
+            first -= every
+        state = self.checkpoints[first]
+        for i in range(first, move):
+            state = state.generateSuccessor(*self.actions[i])
+            if (i + 1) % every == 0:
+                self.checkpoints[i + 1] = state
+        return state
+
+    def getStates(self):
+        "Yields the state before the first move and after each move"
+        state = self.checkpoints[0]
+        yield state
+        for agentIndex, action in self.actions:
+            state = state.generateSuccessor(agentIndex, action)
+            yield state
+
+    def getFinalState(self):
+        return self.getState(len(self.actions))
+
+    def getTransitions(self, agentIndex=0):
+        """
+        Returns the game as a learning agent playing agentIndex saw it
+        (see ReinforcementAgent.observationFunction and final): a list of
+        (state, action, nextState, reward) where state is the state the
+        agent acted in, nextState the state at its next turn or the end of
+        the game, and reward the change in score in between.
+        """
+        transitions = []
+        last = None
+        state = self.checkpoints[0]
+        for mover, action in self.actions:
+            if mover == agentIndex:
+                if last is not None:
+                    transitions.append((last[0], last[1], state, state.getScore() - last[0].getScore()))
+                last = (state, action)
+            state = state.generateSuccessor(mover, action)
+        if last is not None:
+            transitions.append((last[0], last[1], state, state.getScore() - last[0].getScore()))
+        return transitions
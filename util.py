@@ -15,6 +15,7 @@
 import sys
 import inspect
 import heapq, random
+import array, math
 import cStringIO
 
 
@@ -425,6 +426,227 @@ class Counter(dict):
             addend[key] = -1 * y[key]
         return addend
 
+class QTable:
+    """
+    A table of values for (state, action) pairs, usable in place of a
+    dict keyed by such pairs.  States are interned to row numbers
+    through their getCompactKey method when they have one (see
+    pacman.GameState), so the table keeps no states alive.  Actions
+    are columns; the values live in one flat array of doubles that
+    grows chunkSize rows at a time and gets wider if more actions
+    show up than it has columns.
+
+    Keys read back from keys() and items() hold the compact state
+    keys.  They can be stored in another QTable unchanged.
+
+    After trackChanges, the table remembers what each entry held before
+    it was first changed, so that the changes can be listed (getChanges)
+    or undone (revertChanges) without scanning the whole table.
+
+    >>> q = QTable()
+    >>> q[((1, 2), 'north')] = 0.5
+    >>> q.get(((1, 2), 'north'), 0.0), q.get(((1, 2), 'south'), 0.0)
+    (0.5, 0.0)
+    >>> q.getValues((1, 2), ['south', 'north'])
+    [0.0, 0.5]
+    >>> q.trackChanges()
+    >>> q[((1, 2), 'south')] = 1.0
+    >>> q.getChanges()
+    {((1, 2), 'south'): 1.0}
+    >>> q.revertChanges()
+    >>> len(q), q.get(((1, 2), 'south'), 0.0)
+    (1, 0.0)
+    """
+    originals = None     # key -> value before its first tracked change (None if unset)
+
+    def __init__(self, numColumns=5, chunkSize=1024):
+        self.rows = {}       # compact state key -> row
+        self.stateKeys = []  # row -> compact state key
+        self.columns = {}    # action -> column
+        self.actions = []    # column -> action
+        self.width = numColumns
+        self.chunkSize = chunkSize
+        self.values = array.array('d')
+        self.written = array.array('b')   # 1 where a value was stored
+        self.size = 0
+
+    def getStateKey(self, state):
+        if hasattr(state, 'getCompactKey'):
+            return state.getCompactKey()
+        return state
+
+    def getValues(self, state, actions):
+        """
+        Returns the values of state for each of actions, 0.0 for
+        those never stored, with a single row lookup.
+        """
+        row = self.rows.get(self.getStateKey(state))
+        if row is None:
+            return [0.0] * len(actions)
+        start = row * self.width
+        values = self.values
+        columns = self.columns
+        return [values[start + columns[action]] if action in columns else 0.0 for action in actions]
+
+    def get(self, key, default=None):
+        index = self._index(key, False)
+        if index < 0 or not self.written[index]:
+            return default
+        return self.values[index]
+
+    def __getitem__(self, key):
+        index = self._index(key, False)
+        if index < 0 or not self.written[index]:
+            raise KeyError(key)
+        return self.values[index]
+
+    def __setitem__(self, key, value):
+        index = self._index(key, True)
+        if self.originals is not None:
+            trackedKey = (self.stateKeys[index // self.width], self.actions[index % self.width])
+            if trackedKey not in self.originals:
+                if self.written[index]:
+                    self.originals[trackedKey] = self.values[index]
+                else:
+                    self.originals[trackedKey] = None
+        if not self.written[index]:
+            self.written[index] = 1
+            self.size += 1
+        self.values[index] = value
+
+    def __contains__(self, key):
+        index = self._index(key, False)
+        return index >= 0 and self.written[index] == 1
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def items(self):
+        items = []
+        values = self.values
+        written = self.written
+        for row, stateKey in enumerate(self.stateKeys):
+            start = row * self.width
+            for column, action in enumerate(self.actions):
+                if written[start + column]:
+                    items.append(((stateKey, action), values[start + column]))
+        return items
+
+    def keys(self):
+        return [key for key, value in self.items()]
+
+    def update(self, other):
+        for key, value in other.items():
+            self[key] = value
+
+    def trackChanges(self):
+        "Starts (or restarts) remembering the entries that change"
+        self.originals = {}
+
+    def getChanges(self):
+        "Returns the entries changed since trackChanges, with their values"
+        return dict([(key, self[key]) for key in self.originals])
+
+    def revertChanges(self):
+        "Undoes the changes since trackChanges and starts tracking afresh"
+        originals = self.originals
+        self.originals = None
+        for key, value in originals.items():
+            if value is None:
+                index = self._index(key, False)
+                self.written[index] = 0
+                self.values[index] = 0.0
+                self.size -= 1
+            else:
+                self[key] = value
+        self.originals = {}
+
+    def _index(self, key, create):
+        state, action = key
+        stateKey = self.getStateKey(state)
+        row = self.rows.get(stateKey)
+        column = self.columns.get(action)
+        if row is None or column is None:
+            if not create:
+                return -1
+            if column is None:
+                column = self._addColumn(action)
+            if row is None:
+                row = self._addRow(stateKey)
+        return row * self.width + column
+
+    def _addRow(self, stateKey):
+        row = len(self.stateKeys)
+        self.rows[stateKey] = row
+        self.stateKeys.append(stateKey)
+        if len(self.values) < (row + 1) * self.width:
+            cells = self.chunkSize * self.width
+            self.values.extend(array.array('d', [0.0]) * cells)
+            self.written.extend(array.array('b', [0]) * cells)
+        return row
+
+    def _addColumn(self, action):
+        column = len(self.actions)
+        if column == self.width:
+            self._resize(self.width * 2)
+        self.columns[action] = column
+        self.actions.append(action)
+        return column
+
+    def _resize(self, width):
+        numRows = len(self.values) // self.width
+        values = array.array('d', [0.0]) * (numRows * width)
+        written = array.array('b', [0]) * (numRows * width)
+        for row in range(len(self.stateKeys)):
+            old, new = row * self.width, row * width
+            values[new:new + self.width] = self.values[old:old + self.width]
+            written[new:new + self.width] = self.written[old:old + self.width]
+        self.values, self.written, self.width = values, written, width
+
+
+class DistinctCounter:
+    """
+    Estimates how many distinct items were added, in constant memory,
+    with a HyperLogLog sketch of 2**precision one-byte registers.  With
+    the default precision (4096 registers) estimates are typically
+    within a couple of percent.  Items must be hashable; offers the
+    add / len interface of a set.
+
+    >>> c = DistinctCounter()
+    >>> for i in range(1000): c.add(i % 100)
+    >>> 95 <= len(c) <= 105
+    True
+    """
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, item):
+        # Spread the bits of hash(item) over 64 bits (splitmix64 finalizer)
+        h = hash(item) & 0xFFFFFFFFFFFFFFFF
+        h = ((h ^ (h >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+        h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+        h ^= h >> 31
+        register = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        # position of the leftmost 1 bit in the remaining bits
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def __len__(self):
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum([2.0 ** -r for r in self.registers])
+        zeros = self.registers.count(chr(0))
+        if estimate <= 2.5 * m and zeros:
+            # few items: count empty registers instead
+            estimate = m * math.log(float(m) / zeros)
+        return int(round(estimate))
+
+
 def raiseNotDefined():
     fileName = inspect.stack()[1][1]
     line = inspect.stack()[1][2]
@@ -540,6 +762,12 @@ def arrayInvert(array):
             result[inner].append(outer[inner])
     return result
 
+def dotProduct(xs, ys):
+    """
+    Returns the dot product of two equally long lists of numbers.
+    """
+    return sum([x * y for x, y in zip(xs, ys)])
+
 def matrixAsList( matrix, value = True ):
     """
     Turns a matrix into a list of coordinates matching the specified value
@@ -622,6 +850,51 @@ class TimeoutFunction:
         return result
 
 
+class Timings:
+    """
+    Cumulative seconds and number of calls per key, where keys are
+    (agentIndex, hook) pairs such as (0, 'getAction').  Hooks may nest
+    (an update runs inside observationFunction, feature extraction
+    inside both), so the seconds of different hooks overlap.
+
+    >>> t = Timings()
+    >>> double = t.timed((0, 'double'), lambda x: 2 * x)
+    >>> double(2), double(3), t.calls[(0, 'double')]
+    (4, 6, 2)
+    """
+    def __init__(self):
+        self.seconds = Counter()
+        self.calls = Counter()
+
+    def add(self, key, seconds, calls=1):
+        self.seconds[key] += seconds
+        self.calls[key] += calls
+
+    def timed(self, key, function):
+        "Wraps function so that its calls are added under key"
+        def timedFunction(*args):
+            start = time.time()
+            try:
+                return function(*args)
+            finally:
+                self.add(key, time.time() - start)
+        return timedFunction
+
+    def merge(self, other):
+        "Adds the seconds and calls of another Timings to these"
+        for key in other.calls:
+            self.add(key, other.seconds[key], other.calls[key])
+
+    def summary(self):
+        "Returns a table of the timings, one line per key"
+        lines = ['%5s  %-20s %10s %10s %10s' % ('Agent', 'Hook', 'Calls', 'Seconds', 'us/call')]
+        for key in sorted(self.calls):
+            agentIndex, hook = key
+            calls, seconds = self.calls[key], self.seconds[key]
+            lines.append('%5s  %-20s %10d %10.3f %10.1f' % (agentIndex, hook, calls, seconds,
+                                                           1e6 * seconds / max(calls, 1)))
+        return '\n'.join(lines)
+
 
 _ORIGINAL_STDOUT = None
 _ORIGINAL_STDERR = None
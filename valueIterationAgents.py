@@ -0,0 +1,126 @@
+# valueIterationAgents.py
+# -----------------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+from array import array
+
+from learningAgents import ValueEstimationAgent
+
+class ValueIterationAgent(ValueEstimationAgent):
+    """
+        * Please read learningAgents.py before reading this.*
+
+        A ValueIterationAgent takes a Markov decision process
+        (see mdp.py) on initialization and runs value iteration
+        for a given number of iterations using the supplied
+        discount factor.
+
+        Each iteration is a batch sweep: every new value is computed
+        from the values of the previous iteration.  The MDP is read
+        once through mdp.getTransitionArrays, so sweeps over large
+        grids only loop over flat arrays.
+    """
+    def __init__(self, mdp, discount = 0.9, iterations = 100):
+        """
+          Your value iteration agent should take an mdp on
+          construction, run the indicated number of iterations
+          and then act according to the resulting policy.
+
+          Some useful mdp methods you will use:
+              mdp.getStates()
+              mdp.getPossibleActions(state)
+              mdp.getTransitionStatesAndProbs(state, action)
+              mdp.getReward(state, action, nextState)
+              mdp.isTerminal(state)
+              mdp.getTransitionArrays()
+        """
+        self.mdp = mdp
+        self.discount = discount
+        self.iterations = iterations
+        self.transitions = mdp.getTransitionArrays()
+        self.values = array('d', [0.0]) * self.transitions.getNumStates()
+        self.runValueIteration()
+
+    def runValueIteration(self):
+        t = self.transitions
+        actionStart, entryStart = t.actionStart, t.entryStart
+        nextStates, probs, rewards = t.nextStates, t.probs, t.rewards
+        discount = self.discount
+        numStates = t.getNumStates()
+        values = self.values
+        for iteration in range(self.iterations):
+            newValues = array('d', [0.0]) * numStates
+            for i in xrange(numStates):
+                lo, hi = actionStart[i], actionStart[i+1]
+                if lo == hi: continue
+                best = None
+                for row in xrange(lo, hi):
+                    q = 0.0
+                    for k in xrange(entryStart[row], entryStart[row+1]):
+                        q += probs[k] * (rewards[k] + discount * values[nextStates[k]])
+                    if best is None or q > best:
+                        best = q
+                newValues[i] = best
+            if newValues == values:
+                # A fixed point: the remaining sweeps would change nothing
+                break
+            values = newValues
+        self.values = values
+
+    def getValue(self, state):
+        """
+          Return the value of the state (computed in __init__).
+        """
+        i = self.transitions.stateIndex.get(state)
+        if i is None: return 0.0
+        return self.values[i]
+
+    def computeQValueFromValues(self, state, action):
+        """
+          Compute the Q-value of action in state from the
+          value function stored in self.values.
+        """
+        t = self.transitions
+        row = t.getRow(state, action)
+        if row is None: return 0.0
+        q = 0.0
+        for k in xrange(t.entryStart[row], t.entryStart[row+1]):
+            q += t.probs[k] * (t.rewards[k] + self.discount * self.values[t.nextStates[k]])
+        return q
+
+    def computeActionFromValues(self, state):
+        """
+          The policy is the best action in the given state
+          according to the values currently stored in self.values.
+
+          You may break ties any way you see fit.  Note that if
+          there are no legal actions, which is the case at the
+          terminal state, you should return None.
+        """
+        bestAction, bestValue = None, None
+        for row in self.transitions.getRows(state):
+            action = self.transitions.actions[self.transitions.rowActions[row]]
+            q = self.computeQValueFromValues(state, action)
+            if bestValue is None or q > bestValue:
+                bestAction, bestValue = action, q
+        return bestAction
+
+    def getPolicy(self, state):
+        return self.computeActionFromValues(state)
+
+    def getAction(self, state):
+        "Returns the policy at the state (no exploration)."
+        return self.computeActionFromValues(state)
+
+    def getQValue(self, state, action):
+        return self.computeQValueFromValues(state, action)